@@ -5,6 +5,7 @@ Flask application for Phase 2 - Enhanced with extracted content
 from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
 from datetime import datetime
 from utils import BrainGymUtils
+from database import insert_insight_row
 from classifier import InsightClassifier
 import os
 
@@ -118,45 +119,45 @@ def add():
             flash('Please provide content', 'error')
             return redirect(url_for('add'))
         
-        # Insert directly into database
-        conn = utils.get_connection()
-        cursor = conn.cursor()
-        
+        # Insert directly into database (pooled connection, WAL + synchronous=NORMAL)
         try:
-            # Determine content category
-            if source_url:
-                if 'twitter.com' in source_url or 'x.com' in source_url:
-                    category = 'social_reference'
-                elif 'linkedin.com' in source_url:
-                    category = 'social_reference'
-                elif 'youtube.com' in source_url:
-                    category = 'video'
-                elif 'github.com' in source_url:
-                    category = 'code'
+            with utils.borrow() as conn:
+                cursor = conn.cursor()
+                
+                # Determine content category
+                if source_url:
+                    if 'twitter.com' in source_url or 'x.com' in source_url:
+                        category = 'social_reference'
+                    elif 'linkedin.com' in source_url:
+                        category = 'social_reference'
+                    elif 'youtube.com' in source_url:
+                        category = 'video'
+                    elif 'github.com' in source_url:
+                        category = 'code'
+                    else:
+                        category = 'article'
                 else:
-                    category = 'article'
-            else:
-                category = 'my_note'
-            
-            # Auto-classify tags
-            tags = classifier.classify(content, '')
-            tags_str = ','.join(list(set(tags))) if tags else ''
-            
-            cursor.execute("""
-                INSERT INTO insights 
-                (content, source_url, content_category, tags, status, 
-                 quality_score, useful_for_daily, shared_date)
-                VALUES (?, ?, ?, ?, 'pending', 7, 1, ?)
-            """, (content, source_url, category, tags_str, datetime.now().isoformat()))
+                    category = 'my_note'
+                
+                # Auto-classify tags
+                tags = classifier.classify(content, '')
+                tags_str = ','.join(list(set(tags))) if tags else ''
+                
+                insight_id = insert_insight_row(
+                    cursor,
+                    content=content, source_url=source_url, content_category=category,
+                    tags=tags_str, status='pending', quality_score=7, useful_for_daily=1,
+                    shared_date=datetime.now().isoformat()
+                )
             
-            insight_id = cursor.lastrowid
-            conn.commit()
+            if insight_id is None:
+                flash('That insight is already in your library', 'info')
+                return redirect(url_for('home'))
+            utils.invalidate_stats()
             flash(f'Insight added! (ID: {insight_id})', 'success')
             return redirect(url_for('home'))
         except Exception as e:
             flash(f'Error adding insight: {str(e)}', 'error')
-        finally:
-            conn.close()
     
     return render_template('add.html')
 
@@ -5,6 +5,7 @@ Runs all cleaning operations in sequence
 """
 import sys
 import os
+from itertools import islice
 
 
 def main():
@@ -118,8 +119,7 @@ def print_cleaning_stats(stats: dict):
     
     if stats.get('by_domain'):
         print(f"\n🌐 TOP DOMAINS:")
-        for domain, count in sorted(stats['by_domain'].items(), 
-                                    key=lambda x: x[1], reverse=True)[:10]:
+        for domain, count in islice(stats['by_domain'].items(), 10):
             print(f"   {domain}: {count}")
 
 
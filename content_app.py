@@ -6,6 +6,7 @@ PLG Phase 1: Auth, freemium, watermark, public voice, share, referral
 from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
 from content_generator import ContentGenerator
 from search_engine import ContentSearchEngine
+from database import insert_insight_row
 import sqlite3
 
 try:
@@ -667,26 +668,18 @@ def view_synthesis(synthesis_id):
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM syntheses WHERE id = ?', (synthesis_id,))
     row = cursor.fetchone()
-    conn.close()
     if not row:
+        conn.close()
         flash('Synthesis not found', 'error')
         return redirect(url_for('query_interface'))
     synthesis = dict(row)
-    insight_ids = []
-    if synthesis.get('source_insights'):
-        try:
-            insight_ids = json.loads(synthesis['source_insights'])
-        except Exception:
-            pass
-    insights = []
-    if insight_ids:
-        conn = sqlite3.connect('braingym.db')
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        placeholders = ','.join('?' * len(insight_ids))
-        cursor.execute(f'SELECT * FROM insights WHERE id IN ({placeholders})', insight_ids)
-        insights = [dict(r) for r in cursor.fetchall()]
-        conn.close()
+    cursor.execute('''
+        SELECT i.* FROM synthesis_insights si
+        JOIN insights i ON i.id = si.insight_id
+        WHERE si.synthesis_id = ?
+    ''', (synthesis_id,))
+    insights = [dict(r) for r in cursor.fetchall()]
+    conn.close()
     return render_template('synthesis_view.html', synthesis=synthesis, insights=insights)
 
 
@@ -1014,17 +1007,13 @@ def import_bookmarks():
             title = (b.get('title') or url)[:500]
             cursor.execute("PRAGMA table_info(insights)")
             c2 = [row[1] for row in cursor.fetchall()]
+            fields = dict(content=title, source_url=url, source_type='article', content_category='article',
+                          shared_by='bookmark_import', shared_date=datetime.now().isoformat(),
+                          quality_score=7, useful_for_daily=1)
             if 'user_id' in c2 and 'trial_key' in c2:
-                cursor.execute('''
-                    INSERT INTO insights (content, source_url, source_type, content_category, shared_by, shared_date, quality_score, useful_for_daily, user_id, trial_key)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (title, url, 'article', 'article', 'bookmark_import', datetime.now().isoformat(), 7, 1, user_id, None))
-            else:
-                cursor.execute('''
-                    INSERT INTO insights (content, source_url, source_type, content_category, shared_by, shared_date, quality_score, useful_for_daily)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (title, url, 'article', 'article', 'bookmark_import', datetime.now().isoformat(), 7, 1))
-            imported += 1
+                fields.update(user_id=user_id, trial_key=None)
+            if insert_insight_row(cursor, **fields) is not None:
+                imported += 1
         conn.commit()
         conn.close()
         flash(f'Imported {imported} bookmarks!', 'success')
@@ -1344,35 +1333,19 @@ def save_url(url, context_note='', user_id=None, trial_key=None):
         cursor = conn.cursor()
         cursor.execute("PRAGMA table_info(insights)")
         cols = [row[1] for row in cursor.fetchall()]
+        fields = dict(
+            content=title, source_url=url, source_type=category, content_category=category,
+            shared_by='manual_save', shared_date=datetime.now().isoformat(), context_message=context_note,
+            extracted_text=markdown, extraction_status='success',
+            quality_score=8, useful_for_daily=1, tags=','.join(tags) if tags else None
+        )
         if 'user_id' in cols and 'trial_key' in cols:
-            cursor.execute('''
-                INSERT INTO insights (
-                    content, source_url, source_type, content_category,
-                    shared_by, shared_date, context_message,
-                    extracted_text, extraction_status,
-                    quality_score, useful_for_daily, tags, user_id, trial_key
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                title, url, category, category, 'manual_save',
-                datetime.now().isoformat(), context_note, markdown, 'success',
-                8, 1, ','.join(tags) if tags else None, user_id, trial_key
-            ))
-        else:
-            cursor.execute('''
-                INSERT INTO insights (
-                    content, source_url, source_type, content_category,
-                    shared_by, shared_date, context_message,
-                    extracted_text, extraction_status,
-                    quality_score, useful_for_daily, tags
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                title, url, category, category, 'manual_save',
-                datetime.now().isoformat(), context_note, markdown, 'success',
-                8, 1, ','.join(tags) if tags else None
-            ))
-        insight_id = cursor.lastrowid
+            fields.update(user_id=user_id, trial_key=trial_key)
+        insight_id = insert_insight_row(cursor, **fields)
         conn.commit()
         conn.close()
+        if insight_id is None:
+            return {'success': False, 'message': 'Already saved to your library.'}
         print(f"✅ Saved! ID: {insight_id}, Extracted {len(markdown)} chars")
         return {
             'success': True,
@@ -1413,31 +1386,18 @@ def save_note(text, context='', user_id=None, trial_key=None):
         cursor = conn.cursor()
         cursor.execute("PRAGMA table_info(insights)")
         cols = [row[1] for row in cursor.fetchall()]
+        fields = dict(
+            content=text, source_type='my_note', content_category='my_note',
+            shared_by='manual_save', shared_date=datetime.now().isoformat(), context_message=context,
+            quality_score=quality, useful_for_daily=1, tags=','.join(tags) if tags else None
+        )
         if 'user_id' in cols and 'trial_key' in cols:
-            cursor.execute('''
-                INSERT INTO insights (
-                    content, source_type, content_category,
-                    shared_by, shared_date, context_message,
-                    quality_score, useful_for_daily, tags, user_id, trial_key
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                text, 'my_note', 'my_note', 'manual_save', datetime.now().isoformat(),
-                context, quality, 1, ','.join(tags) if tags else None, user_id, trial_key
-            ))
-        else:
-            cursor.execute('''
-                INSERT INTO insights (
-                    content, source_type, content_category,
-                    shared_by, shared_date, context_message,
-                    quality_score, useful_for_daily, tags
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                text, 'my_note', 'my_note', 'manual_save', datetime.now().isoformat(),
-                context, quality, 1, ','.join(tags) if tags else None
-            ))
-        insight_id = cursor.lastrowid
+            fields.update(user_id=user_id, trial_key=trial_key)
+        insight_id = insert_insight_row(cursor, **fields)
         conn.commit()
         conn.close()
+        if insight_id is None:
+            return {'success': False, 'message': 'Already saved to your library.'}
         print(f"✅ Note saved! ID: {insight_id}, Tags: {tags}")
         tag_msg = f' Auto-tagged: {", ".join(tags[:3])}' if tags else ''
         return {
@@ -2,11 +2,70 @@
 Database module for Brain Gym - handles SQLite schema and operations
 """
 import sqlite3
+import hashlib
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 from contextlib import contextmanager
 
 
+def content_hash(
+    content: str,
+    source_url: Optional[str] = None,
+    shared_by: Optional[str] = None,
+    shared_date: Optional[str] = None
+) -> bytes:
+    """Dedup key for an insight: blake2b of the whitespace-normalized fields"""
+    normalized = "\x1f".join(
+        " ".join((value or "").split())
+        for value in (content, source_url, shared_by, shared_date)
+    )
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+
+
+def migrate_content_hash(cursor):
+    """Add the content_hash column + UNIQUE index (backfilling rows when the column is new)"""
+    cursor.execute("PRAGMA table_info(insights)")
+    columns = {row[1] for row in cursor.fetchall()}
+    if not columns:
+        return  # No insights table in this database yet
+    added = 'content_hash' not in columns
+    if added:
+        cursor.execute("ALTER TABLE insights ADD COLUMN content_hash BLOB")
+    
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_insights_content_hash
+        ON insights(content_hash)
+    """)
+    
+    if added:
+        # Rows that collide after normalization keep a NULL hash
+        cursor.execute("""
+            SELECT id, content, source_url, shared_by, shared_date
+            FROM insights
+        """)
+        cursor.executemany(
+            "UPDATE OR IGNORE insights SET content_hash = ? WHERE id = ?",
+            [(content_hash(*row[1:]), row[0]) for row in cursor.fetchall()]
+        )
+
+
+def insert_insight_row(cursor, **fields) -> Optional[int]:
+    """
+    INSERT OR IGNORE one insights row with its content_hash filled in, so the
+    UNIQUE index dedups every writer. Returns the new id (None if duplicate).
+    """
+    fields['content_hash'] = content_hash(
+        fields.get('content'), fields.get('source_url'),
+        fields.get('shared_by'), fields.get('shared_date')
+    )
+    cursor.execute(
+        f"INSERT OR IGNORE INTO insights ({', '.join(fields)}) "
+        f"VALUES ({', '.join('?' * len(fields))})",
+        tuple(fields.values())
+    )
+    return cursor.lastrowid if cursor.rowcount else None
+
+
 class BrainGymDB:
     """Manages the Brain Gym SQLite database"""
     
@@ -48,10 +107,12 @@ class BrainGymDB:
                     response_date TEXT,
                     status TEXT DEFAULT 'pending',
                     created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(content, source_url, shared_by, shared_date)
+                    content_hash BLOB
                 )
             """)
             
+            migrate_content_hash(cursor)
+            
             # Stats table for tracking
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS stats (
@@ -76,26 +137,18 @@ class BrainGymDB:
         tags: Optional[List[str]] = None,
         status: str = "pending"
     ) -> Optional[int]:
-        """Insert a new insight into the database"""
+        """Insert a new insight into the database (None if duplicate)"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
-            tags_str = ",".join(tags) if tags else None
-            
-            try:
-                cursor.execute("""
-                    INSERT INTO insights (
-                        content, source_url, source_type, shared_by,
-                        shared_date, context_message, tags, status
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    content, source_url, source_type, shared_by,
-                    shared_date, context_message, tags_str, status
-                ))
-                return cursor.lastrowid
-            except sqlite3.IntegrityError:
-                # Duplicate entry, skip
-                return None
+            # The UNIQUE index on content_hash makes SQLite do the dedup check
+            return insert_insight_row(
+                cursor,
+                content=content, source_url=source_url, source_type=source_type,
+                shared_by=shared_by, shared_date=shared_date,
+                context_message=context_message,
+                tags=",".join(tags) if tags else None, status=status
+            )
     
     def get_insights(
         self,
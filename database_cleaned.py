@@ -4,6 +4,7 @@ Adds columns for content extraction and categorization
 """
 import sqlite3
 from contextlib import contextmanager
+from plg_migrate import migrate_domain
 
 
 class CleanedDatabase:
@@ -64,6 +65,9 @@ class CleanedDatabase:
                 WHERE content_length = 0 OR content_length IS NULL
             """)
             
+            # Site per insight (kept in sync with source_url by triggers)
+            migrate_domain(cursor)
+            
             print(f"\n✅ Schema migration complete")
             conn.commit()
     
@@ -108,6 +112,24 @@ class CleanedDatabase:
                 WHERE id = ?
             """, (extracted_text, metadata, status, datetime.now().isoformat(), error, insight_id))
     
+    def update_extractions(self, results: list):
+        """Update extraction results in one transaction
+        results: (insight_id, extracted_text, metadata, status, error) tuples
+        """
+        from datetime import datetime
+        now = datetime.now().isoformat()
+        with self.get_connection() as conn:
+            conn.executemany("""
+                UPDATE insights 
+                SET extracted_text = ?,
+                    extracted_metadata = ?,
+                    extraction_status = ?,
+                    extraction_date = ?,
+                    extraction_error = ?
+                WHERE id = ?
+            """, [(text, metadata, status, now, error, insight_id)
+                  for insight_id, text, metadata, status, error in results])
+    
     def get_insights_by_category(self, category: str):
         """Get all insights in a category"""
         with self.get_connection() as conn:
@@ -142,11 +164,12 @@ class CleanedDatabase:
             cursor = conn.cursor()
             stats = {}
             
-            # Category breakdown
+            # Category breakdown (dicts below keep SQL order: largest first)
             cursor.execute("""
                 SELECT content_category, COUNT(*) as count 
                 FROM insights 
                 GROUP BY content_category
+                ORDER BY count DESC, content_category
             """)
             stats['by_category'] = {row['content_category']: row['count'] 
                                    for row in cursor.fetchall()}
@@ -187,24 +210,28 @@ class CleanedDatabase:
             result = cursor.fetchone()
             stats['avg_extracted_length'] = int(result['avg_length']) if result['avg_length'] else 0
             
-            # Top domains
+            # Top domains (counted per site on idx_insights_site, then labelled)
             cursor.execute("""
                 SELECT 
                     CASE 
-                        WHEN source_url LIKE '%linkedin.com%' THEN 'LinkedIn'
-                        WHEN source_url LIKE '%twitter.com%' OR source_url LIKE '%x.com%' THEN 'Twitter'
-                        WHEN source_url LIKE '%youtube.com%' OR source_url LIKE '%youtu.be%' THEN 'YouTube'
-                        WHEN source_url LIKE '%medium.com%' THEN 'Medium'
-                        WHEN source_url LIKE '%substack.com%' THEN 'Substack'
-                        WHEN source_url LIKE '%github.com%' THEN 'GitHub'
-                        WHEN source_url LIKE '%reddit.com%' THEN 'Reddit'
+                        WHEN site = 'linkedin.com' THEN 'LinkedIn'
+                        WHEN site IN ('twitter.com', 'x.com') THEN 'Twitter'
+                        WHEN site IN ('youtube.com', 'youtu.be') THEN 'YouTube'
+                        WHEN site = 'medium.com' THEN 'Medium'
+                        WHEN site = 'substack.com' THEN 'Substack'
+                        WHEN site = 'github.com' THEN 'GitHub'
+                        WHEN site = 'reddit.com' THEN 'Reddit'
                         ELSE 'Other'
                     END as domain,
-                    COUNT(*) as count
-                FROM insights 
-                WHERE source_url IS NOT NULL
-                GROUP BY domain
-                ORDER BY count DESC
+                    SUM(site_count) as count
+                FROM (
+                    SELECT site, COUNT(*) as site_count
+                    FROM insights 
+                    WHERE site IS NOT NULL
+                    GROUP BY site
+                )
+                GROUP BY 1
+                ORDER BY count DESC, domain
             """)
             stats['by_domain'] = {row['domain']: row['count'] for row in cursor.fetchall()}
             
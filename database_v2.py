@@ -6,6 +6,7 @@ import sqlite3
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
 from contextlib import contextmanager
+from database import insert_insight_row, migrate_content_hash
 
 
 class BrainGymDBV2:
@@ -65,6 +66,9 @@ class BrainGymDBV2:
                 WHERE quality_score = 5 OR quality_score IS NULL
             """)
             
+            # Dedup hash for add_manual_insight
+            migrate_content_hash(cursor)
+            
             # Create responses table
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS responses (
@@ -384,8 +388,8 @@ class BrainGymDBV2:
         return streak
     
     def add_manual_insight(self, content: str, source_url: str = None,
-                          context: str = None, tags: List[str] = None) -> int:
-        """Manually add an insight"""
+                          context: str = None, tags: List[str] = None) -> Optional[int]:
+        """Manually add an insight (None if duplicate)"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
@@ -406,18 +410,16 @@ class BrainGymDBV2:
             tags_str = ','.join(tags) if tags else None
             quality_score = 8 if tags and 'high_value' in tags else 5
             
-            cursor.execute("""
-                INSERT INTO insights (
-                    content, source_url, source_type, shared_by,
-                    shared_date, context_message, tags, quality_score, status
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'pending')
-            """, (
-                content, source_url, source_type, 'Manual',
-                datetime.now().isoformat(), context, tags_str, quality_score
-            ))
+            insight_id = insert_insight_row(
+                cursor,
+                content=content, source_url=source_url, source_type=source_type,
+                shared_by='Manual', shared_date=datetime.now().isoformat(),
+                context_message=context, tags=tags_str, quality_score=quality_score,
+                status='pending'
+            )
             
             conn.commit()
-            return cursor.lastrowid
+            return insight_id
     
     def get_insight(self, insight_id: int) -> Optional[Dict[str, Any]]:
         """Get a single insight by ID"""
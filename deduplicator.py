@@ -62,9 +62,11 @@ class Deduplicator:
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        # Get all non-junk insights without URLs (to check content similarity)
+        # Get all non-junk insights without URLs (to check content similarity);
+        # plain (id, content) tuples, unpacked positionally in the pair loop
+        cursor.row_factory = None
         cursor.execute("""
-            SELECT id, content, content_length
+            SELECT id, content
             FROM insights
             WHERE content_category != 'junk'
             AND (source_url IS NULL OR source_url = '')
@@ -72,7 +74,7 @@ class Deduplicator:
             ORDER BY id
         """)
         
-        insights = [dict(row) for row in cursor.fetchall()]
+        insights = cursor.fetchall()
         conn.close()
         
         duplicates = []
@@ -80,30 +82,27 @@ class Deduplicator:
         
         print(f"\n🔍 Checking {len(insights)} insights for content similarity...")
         
-        for i, insight1 in enumerate(insights):
-            if insight1['id'] in checked:
+        for i, (id1, content1) in enumerate(insights):
+            if id1 in checked:
                 continue
             
             duplicate_ids = []
             
             # Compare with later insights
-            for insight2 in insights[i+1:]:
-                if insight2['id'] in checked:
+            for id2, content2 in insights[i+1:]:
+                if id2 in checked:
                     continue
                 
-                similarity = self._similarity(
-                    insight1['content'],
-                    insight2['content']
-                )
+                similarity = self._similarity(content1, content2)
                 
                 if similarity >= threshold:
-                    duplicate_ids.append(insight2['id'])
-                    checked.add(insight2['id'])
+                    duplicate_ids.append(id2)
+                    checked.add(id2)
             
             if duplicate_ids:
                 duplicates.append({
                     'type': 'content',
-                    'original_id': insight1['id'],
+                    'original_id': id1,
                     'duplicate_ids': duplicate_ids
                 })
             
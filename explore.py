@@ -2,9 +2,9 @@
 """
 Brain Gym Explorer - Interactive database exploration
 """
+import sys
 import sqlite3
 import argparse
-from collections import Counter
 from typing import List, Dict
 
 
@@ -82,6 +82,8 @@ class BrainGymExplorer:
     
     def analyze_tags(self):
         """Analyze tag distribution"""
+        from collections import Counter
+        
         conn = self.get_connection()
         cursor = conn.cursor()
         
@@ -118,32 +120,87 @@ class BrainGymExplorer:
     
     def display_insights(self, insights: List[Dict], title: str):
         """Display insights in a nice format"""
-        print("\n" + "="*70)
-        print(f"🧠 {title}")
-        print("="*70)
-        print(f"Found {len(insights)} insights\n")
+        out = [
+            "\n" + "="*70 + "\n",
+            f"🧠 {title}\n",
+            "="*70 + "\n",
+            f"Found {len(insights)} insights\n\n",
+        ]
         
         for i, insight in enumerate(insights, 1):
-            print(f"[{i}] ID: {insight['id']}")
-            print(f"👤 {insight['shared_by']} | 📅 {insight['shared_date']}")
-            print(f"🔖 {insight['source_type']}")
+            out.append(f"[{i}] ID: {insight['id']}\n")
+            out.append(f"👤 {insight['shared_by']} | 📅 {insight['shared_date']}\n")
+            out.append(f"🔖 {insight['source_type']}\n")
             
             if insight['tags']:
                 tags = insight['tags'].split(',')
-                print(f"🏷️  {', '.join(tags[:5])}")
+                out.append(f"🏷️  {', '.join(tags[:5])}\n")
             
             content = insight['content']
             if len(content) > 200:
                 content = content[:200] + "..."
-            print(f"💭 {content}")
+            out.append(f"💭 {content}\n")
             
             if insight['source_url']:
                 url = insight['source_url']
                 if len(url) > 80:
                     url = url[:80] + "..."
-                print(f"🔗 {url}")
+                out.append(f"🔗 {url}\n")
             
-            print("-" * 70)
+            out.append("-" * 70 + "\n")
+        
+        sys.stdout.write(''.join(out))
+
+
+def handle_search(explorer: BrainGymExplorer, args):
+    insights = explorer.search_by_keyword(args.search, args.limit)
+    explorer.display_insights(insights, f"Search results for '{args.search}'")
+
+
+def handle_tag(explorer: BrainGymExplorer, args):
+    insights = explorer.get_by_tag(args.tag, args.limit)
+    explorer.display_insights(insights, f"Insights tagged with '{args.tag}'")
+
+
+def handle_type(explorer: BrainGymExplorer, args):
+    insights = explorer.get_by_type(args.type, args.limit)
+    explorer.display_insights(insights, f"Insights of type '{args.type}'")
+
+
+def handle_high_value(explorer: BrainGymExplorer, args):
+    insights = explorer.get_high_value(args.limit)
+    explorer.display_insights(insights, "High-Value Insights")
+
+
+def handle_random(explorer: BrainGymExplorer, args):
+    insights = explorer.random_insights(args.random)
+    explorer.display_insights(insights, f"{args.random} Random Insights")
+
+
+def handle_tags_analysis(explorer: BrainGymExplorer, args):
+    print("\n" + "="*70)
+    print("🏷️  TAG ANALYSIS")
+    print("="*70)
+    
+    tag_counts = explorer.analyze_tags()
+    
+    print(f"\nTotal unique tags: {len(tag_counts)}")
+    print(f"\nTop 30 tags:")
+    
+    for i, (tag, count) in enumerate(tag_counts.most_common(30), 1):
+        bar = "█" * (count // 20)
+        print(f"{i:2d}. {tag:20s} {count:4d} {bar}")
+
+
+# argparse dest -> handler; each handler imports what it needs
+COMMANDS = {
+    'search': handle_search,
+    'tag': handle_tag,
+    'type': handle_type,
+    'high_value': handle_high_value,
+    'random': handle_random,
+    'tags_analysis': handle_tags_analysis,
+}
 
 
 def main():
@@ -152,52 +209,22 @@ def main():
     )
     
     parser.add_argument('--db', default='braingym.db', help='Database path')
-    parser.add_argument('--search', help='Search by keyword')
-    parser.add_argument('--tag', help='Filter by tag')
-    parser.add_argument('--type', help='Filter by type (tweet/article/quote/etc)')
-    parser.add_argument('--high-value', action='store_true', help='Show high-value insights')
-    parser.add_argument('--random', type=int, metavar='N', help='Show N random insights')
-    parser.add_argument('--tags-analysis', action='store_true', help='Analyze tag distribution')
     parser.add_argument('--limit', type=int, default=20, help='Limit results (default: 20)')
     
-    args = parser.parse_args()
-    
-    explorer = BrainGymExplorer(args.db)
-    
-    if args.search:
-        insights = explorer.search_by_keyword(args.search, args.limit)
-        explorer.display_insights(insights, f"Search results for '{args.search}'")
+    commands = parser.add_mutually_exclusive_group()
+    commands.add_argument('--search', help='Search by keyword')
+    commands.add_argument('--tag', help='Filter by tag')
+    commands.add_argument('--type', help='Filter by type (tweet/article/quote/etc)')
+    commands.add_argument('--high-value', action='store_true', help='Show high-value insights')
+    commands.add_argument('--random', type=int, metavar='N', help='Show N random insights')
+    commands.add_argument('--tags-analysis', action='store_true', help='Analyze tag distribution')
     
-    elif args.tag:
-        insights = explorer.get_by_tag(args.tag, args.limit)
-        explorer.display_insights(insights, f"Insights tagged with '{args.tag}'")
-    
-    elif args.type:
-        insights = explorer.get_by_type(args.type, args.limit)
-        explorer.display_insights(insights, f"Insights of type '{args.type}'")
-    
-    elif args.high_value:
-        insights = explorer.get_high_value(args.limit)
-        explorer.display_insights(insights, "High-Value Insights")
-    
-    elif args.random:
-        insights = explorer.random_insights(args.random)
-        explorer.display_insights(insights, f"{args.random} Random Insights")
+    args = parser.parse_args()
     
-    elif args.tags_analysis:
-        print("\n" + "="*70)
-        print("🏷️  TAG ANALYSIS")
-        print("="*70)
-        
-        tag_counts = explorer.analyze_tags()
-        
-        print(f"\nTotal unique tags: {len(tag_counts)}")
-        print(f"\nTop 30 tags:")
-        
-        for i, (tag, count) in enumerate(tag_counts.most_common(30), 1):
-            bar = "█" * (count // 20)
-            print(f"{i:2d}. {tag:20s} {count:4d} {bar}")
+    command = next((name for name in COMMANDS if getattr(args, name)), None)
     
+    if command:
+        COMMANDS[command](BrainGymExplorer(args.db), args)
     else:
         parser.print_help()
         print("\n💡 Example usage:")
@@ -3,12 +3,78 @@ Firecrawl content extraction for external links
 Fetches actual content from URLs and stores in database
 """
 import os
+import re
+import sys
 import json
 import time
+import functools
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, Optional, List
 from datetime import datetime
+from itertools import chain, zip_longest
+from urllib.parse import urlparse
 import sqlite3
 
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+
+def _json_dumps(obj) -> str:
+    """Serialize to a JSON string (orjson when available)"""
+    if HAS_ORJSON:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+
+_WORD_RE = re.compile(r'\S+')
+
+# Scalar counters shared by per-batch and overall extraction stats
+STAT_KEYS = (
+    'success', 'failed', 'failed_404', 'failed_timeout',
+    'failed_rate_limit', 'failed_paywall', 'skipped', 'total_chars_extracted',
+)
+
+# Extraction results are written to the DB in groups of this many
+CHECKPOINT_EVERY = 10
+
+
+@functools.lru_cache(maxsize=4096)
+def _extract_domain(url: str) -> str:
+    """Extract domain from URL (cached across batches)"""
+    return urlparse(url).netloc
+
+
+class RateLimiter:
+    """Space request starts at least `interval` seconds apart across threads"""
+    
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+    
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def _interleave_by_domain(items: list) -> list:
+    """Round-robin (index, insight) pairs across domains, keeping order within each"""
+    by_domain = defaultdict(list)
+    for item in items:
+        by_domain[_extract_domain(item[1]['source_url'])].append(item)
+    _missing = object()
+    return [item for item in chain.from_iterable(zip_longest(*by_domain.values(), fillvalue=_missing))
+            if item is not _missing]
+
 
 class FirecrawlExtractor:
     """Extract content from URLs using Firecrawl API"""
@@ -29,7 +95,8 @@ class FirecrawlExtractor:
     def extract_from_url(self, url: str, timeout: int = 30) -> Dict:
         """
         Extract content from a single URL using Firecrawl
-        Returns: dict with content, metadata, status, error
+        Returns: dict with content, metadata (dict, serialized only at the
+        DB write), status, error
         """
         try:
             # Use Firecrawl's scrape endpoint (correct method name and params)
@@ -45,15 +112,15 @@ class FirecrawlExtractor:
                 metadata = {
                     'title': getattr(metadata_obj, 'title', '') if hasattr(metadata_obj, 'title') else '',
                     'description': getattr(metadata_obj, 'description', '') if hasattr(metadata_obj, 'description') else '',
-                    'domain': self._extract_domain(url),
+                    'domain': _extract_domain(url),
                     'extracted_at': datetime.now().isoformat(),
-                    'word_count': len(result.markdown.split()),
+                    'word_count': sum(1 for _ in _WORD_RE.finditer(result.markdown)),
                     'char_count': len(result.markdown),
                 }
                 
                 return {
                     'content': result.markdown,
-                    'metadata': json.dumps(metadata),
+                    'metadata': metadata,
                     'status': 'success',
                     'error': None
                 }
@@ -87,86 +154,115 @@ class FirecrawlExtractor:
                 'error': error_msg[:500]  # Limit error message length
             }
     
-    def _extract_domain(self, url: str) -> str:
-        """Extract domain from URL"""
-        from urllib.parse import urlparse
-        parsed = urlparse(url)
-        return parsed.netloc
-    
     def process_batch(self, insights: List[Dict], batch_size: int = 50, 
-                     delay: float = 1.0) -> Dict:
+                     delay: float = 1.0, max_workers: int = 8,
+                     executor: Optional[ThreadPoolExecutor] = None,
+                     per_domain: bool = False) -> Dict:
         """
         Process a batch of insights
+        Scrapes run on a thread pool (requests start `delay`s apart, or
+        `delay`s apart per domain with per_domain=True); DB updates happen
+        on the calling thread, CHECKPOINT_EVERY results at a time.
         Returns: stats dict with counts
         """
         from database_cleaned import CleanedDatabase
         
         db = CleanedDatabase(self.db_path)
+        if per_domain:
+            domain_limiters = defaultdict(lambda: RateLimiter(delay))
+        else:
+            limiter = RateLimiter(delay)
         
         stats = {
             'total': len(insights),
-            'success': 0,
-            'failed': 0,
-            'failed_404': 0,
-            'failed_timeout': 0,
-            'failed_rate_limit': 0,
-            'failed_paywall': 0,
-            'skipped': 0,
-            'total_chars_extracted': 0,
-            'by_domain': {}
+            **dict.fromkeys(STAT_KEYS, 0),
+            'by_domain': Counter()
         }
         
-        for i, insight in enumerate(insights, 1):
-            insight_id = insight['id']
-            url = insight['source_url']
-            
-            # Skip if already successfully extracted
-            if insight.get('extraction_status') == 'success':
-                stats['skipped'] += 1
-                print(f"  [{i}/{len(insights)}] Skipped (already extracted): {url[:60]}...")
-                continue
-            
-            print(f"\n  [{i}/{len(insights)}] Extracting: {url[:60]}...")
+        own_executor = executor is None
+        if own_executor:
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+        
+        pending = []
+        try:
+            todo = []
+            for i, insight in enumerate(insights, 1):
+                url = insight['source_url']
+                
+                # Skip if already successfully extracted
+                if insight.get('extraction_status') == 'success':
+                    stats['skipped'] += 1
+                    print(f"  [{i}/{len(insights)}] Skipped (already extracted): {url[:60]}...")
+                    continue
+                
+                todo.append((i, insight))
             
-            # Extract content
-            result = self.extract_from_url(url)
+            if per_domain:
+                # Spread submissions across domains so no worker sits behind one site's limiter
+                todo = _interleave_by_domain(todo)
             
-            # Update database
-            db.update_extraction(
-                insight_id=insight_id,
-                extracted_text=result['content'],
-                metadata=result['metadata'],
-                status=result['status'],
-                error=result['error']
-            )
+            futures = {}
+            for i, insight in todo:
+                url = insight['source_url']
+                if per_domain:
+                    limiter = domain_limiters[_extract_domain(url)]
+                future = executor.submit(self._extract_rate_limited, url, limiter)
+                futures[future] = (i, insight)
             
-            # Update stats
-            if result['status'] == 'success':
-                stats['success'] += 1
-                if result['content']:
-                    stats['total_chars_extracted'] += len(result['content'])
+            for done, future in enumerate(as_completed(futures), 1):
+                i, insight = futures[future]
+                url = insight['source_url']
+                result = future.result()
                 
-                # Track by domain
-                if result['metadata']:
-                    metadata = json.loads(result['metadata'])
-                    domain = metadata.get('domain', 'unknown')
-                    stats['by_domain'][domain] = stats['by_domain'].get(domain, 0) + 1
+                print(f"\n  [{i}/{len(insights)}] Extracted: {url[:60]}...")
                 
-                print(f"    ✓ Success ({len(result['content'])} chars)")
-            else:
-                stats['failed'] += 1
-                if result['status'] in stats:
-                    stats[result['status']] += 1
-                print(f"    ✗ {result['status']}: {result['error'][:100]}")
-            
-            # Rate limiting delay
-            if i < len(insights):
-                time.sleep(delay)
+                # Queue the database update
+                pending.append((
+                    insight['id'],
+                    result['content'],
+                    _json_dumps(result['metadata']) if result['metadata'] else None,
+                    result['status'],
+                    result['error']
+                ))
+                
+                # Update stats
+                if result['status'] == 'success':
+                    stats['success'] += 1
+                    if result['content']:
+                        stats['total_chars_extracted'] += len(result['content'])
+                    
+                    # Track by domain
+                    if result['metadata']:
+                        domain = result['metadata'].get('domain', 'unknown')
+                        stats['by_domain'][domain] += 1
+                    
+                    print(f"    ✓ Success ({len(result['content'])} chars)")
+                else:
+                    stats['failed'] += 1
+                    if result['status'] in stats:
+                        stats[result['status']] += 1
+                    print(f"    ✗ {result['status']}: {result['error'][:100]}")
+                
+                # Checkpoint results; progress lines are buffered, push them out too
+                if done % CHECKPOINT_EVERY == 0:
+                    db.update_extractions(pending)
+                    pending = []
+                    sys.stdout.flush()
+        finally:
+            if pending:
+                db.update_extractions(pending)
+            if own_executor:
+                executor.shutdown()
         
         return stats
     
+    def _extract_rate_limited(self, url: str, limiter: RateLimiter) -> Dict:
+        """Wait for a rate-limit slot, then extract (runs on a worker thread)"""
+        limiter.wait()
+        return self.extract_from_url(url)
+    
     def process_all(self, batch_size: int = 100, delay: float = 1.0, 
-                   max_items: int = None) -> Dict:
+                   max_items: int = None, max_workers: int = 8) -> Dict:
         """
         Process all insights needing extraction
         """
@@ -185,54 +281,52 @@ class FirecrawlExtractor:
             return {}
         
         print(f"\nFound {len(insights)} insights to extract")
-        print(f"Batch size: {batch_size}, Delay: {delay}s between requests")
+        print(f"Batch size: {batch_size}, Delay: {delay}s between requests, Workers: {max_workers}")
         print("\nStarting extraction...\n")
         
         # Process in batches
         all_stats = {
             'total': len(insights),
-            'success': 0,
-            'failed': 0,
-            'failed_404': 0,
-            'failed_timeout': 0,
-            'failed_rate_limit': 0,
-            'failed_paywall': 0,
-            'skipped': 0,
-            'total_chars_extracted': 0,
-            'by_domain': {},
+            **dict.fromkeys(STAT_KEYS, 0),
+            'by_domain': Counter(),
             'started_at': datetime.now().isoformat(),
         }
         
-        for batch_start in range(0, len(insights), batch_size):
-            batch_end = min(batch_start + batch_size, len(insights))
-            batch = insights[batch_start:batch_end]
-            
-            print(f"\n{'='*70}")
-            print(f"BATCH {batch_start//batch_size + 1}: Items {batch_start+1}-{batch_end}")
-            print(f"{'='*70}")
-            
-            batch_stats = self.process_batch(batch, batch_size, delay)
-            
-            # Aggregate stats
-            for key in ['success', 'failed', 'failed_404', 'failed_timeout', 
-                       'failed_rate_limit', 'failed_paywall', 'skipped', 'total_chars_extracted']:
-                all_stats[key] += batch_stats.get(key, 0)
-            
-            # Merge domain stats
-            for domain, count in batch_stats.get('by_domain', {}).items():
-                all_stats['by_domain'][domain] = all_stats['by_domain'].get(domain, 0) + count
-            
-            # Show progress
-            completed = batch_end
-            print(f"\n📊 Progress: {completed}/{len(insights)} ({completed/len(insights)*100:.1f}%)")
-            print(f"   Success: {all_stats['success']}, Failed: {all_stats['failed']}, Skipped: {all_stats['skipped']}")
+        # One pool shared by all batches; the Firecrawl client is reused across threads
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for batch_start in range(0, len(insights), batch_size):
+                batch_end = min(batch_start + batch_size, len(insights))
+                batch = insights[batch_start:batch_end]
+                
+                print(f"\n{'='*70}")
+                print(f"BATCH {batch_start//batch_size + 1}: Items {batch_start+1}-{batch_end}")
+                print(f"{'='*70}")
+                
+                batch_stats = self.process_batch(batch, batch_size, delay,
+                                                 executor=executor)
+                
+                # Aggregate stats
+                for key in STAT_KEYS:
+                    all_stats[key] += batch_stats.get(key, 0)
+                
+                # Merge domain stats
+                all_stats['by_domain'].update(batch_stats.get('by_domain', {}))
+                
+                # Show progress
+                completed = batch_end
+                print(f"\n📊 Progress: {completed}/{len(insights)} ({completed/len(insights)*100:.1f}%)")
+                print(f"   Success: {all_stats['success']}, Failed: {all_stats['failed']}, Skipped: {all_stats['skipped']}")
         
         all_stats['completed_at'] = datetime.now().isoformat()
         
         # Save stats to file
         stats_file = f"extraction_stats_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(stats_file, 'w') as f:
-            json.dump(all_stats, f, indent=2)
+        if HAS_ORJSON:
+            with open(stats_file, 'wb') as f:
+                f.write(orjson.dumps(all_stats, option=orjson.OPT_INDENT_2))
+        else:
+            with open(stats_file, 'w') as f:
+                json.dump(all_stats, f, indent=2)
         
         print(f"\n✅ Extraction complete! Stats saved to: {stats_file}")
         
@@ -2,13 +2,73 @@
 WhatsApp message parser for Brain Gym
 Extracts links, context, and insights from WhatsApp chat exports
 """
+import io
 import re
+import functools
+from collections import Counter
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
-from dataclasses import dataclass
+from typing import List, Dict, Optional, Tuple, Iterable, Iterator
+from dataclasses import dataclass, field
 from urllib.parse import urlparse
 
 
+# Common WhatsApp export patterns
+# Format: [DD/MM/YYYY, HH:MM:SS] Sender: Message
+# or: DD/MM/YYYY, HH:MM - Sender: Message
+_MESSAGE_RES = [
+    re.compile(r'^\[(\d{1,2}/\d{1,2}/\d{2,4}),\s*(\d{1,2}:\d{2}(?::\d{2})?(?:\s*[AP]M)?)\]\s*([^:]+):\s*(.*)'),
+    re.compile(r'^(\d{1,2}/\d{1,2}/\d{2,4}),\s*(\d{1,2}:\d{2}(?::\d{2})?(?:\s*[AP]M)?)\s*-\s*([^:]+):\s*(.*)'),
+]
+
+# Every message line starts with one of these; anything else is a continuation
+_MESSAGE_START_CHARS = frozenset('[0123456789')
+
+# URL pattern: one character class, same characters as the old alternation
+# (letters, digits, and ! plus the $-_ ASCII range, which covers %XX escapes)
+_URL_RE = re.compile(r"https?://[A-Za-z0-9!$%&'()*+,\-./:;<=>?@\[\\\]^_]+")
+
+
+# System notices; one alternation scans a message once for all of them
+_SYSTEM_RE = re.compile('|'.join(re.escape(keyword) for keyword in (
+    'Messages and calls are end-to-end encrypted',
+    'created group',
+    'changed the subject',
+    'left',
+    'added',
+    'removed',
+    'changed this group',
+    'You deleted this message',
+    'This message was deleted',
+)))
+
+# Reactions and short responses that are never insights
+_SHORT_RESPONSES = frozenset({'ok', 'yes', 'no', 'thanks', 'lol', 'haha', '😂', '👍', 'nice', 'cool'})
+
+
+# Host (or parent domain) -> insight source type
+_DOMAIN_TYPES = {
+    'twitter.com': 'tweet',
+    'x.com': 'tweet',
+    'linkedin.com': 'linkedin',
+    'youtube.com': 'video',
+    'youtu.be': 'video',
+    'medium.com': 'article',
+    'substack.com': 'article',
+}
+
+
+def _iter_lines(stream: Iterable[str]) -> Iterator[str]:
+    """Yield lines without their newline, exactly like str.split('\n')"""
+    last = ''
+    for raw in stream:
+        if raw.endswith('\n'):
+            yield raw[:-1]
+            last = ''
+        else:
+            last = raw
+    yield last
+
+
 @dataclass
 class WhatsAppMessage:
     """Represents a parsed WhatsApp message"""
@@ -17,59 +77,49 @@ class WhatsAppMessage:
     sender: str
     content: str
     urls: List[str]
+    datetime_str: str = field(init=False, repr=False, compare=False)
     
-    @property
-    def datetime_str(self) -> str:
-        """Combined date and time string"""
-        return f"{self.date} {self.time}"
+    def __post_init__(self):
+        # Combined date and time string; date/time never change after parsing
+        self.datetime_str = f"{self.date} {self.time}"
     
-    @property
+    @functools.cached_property
     def full_content(self) -> str:
-        """Full message content without URLs"""
-        content = self.content
-        for url in self.urls:
-            content = content.replace(url, "").strip()
-        return content
+        """Full message content without URLs (computed once, after parsing)"""
+        if not self.urls:
+            return self.content
+        return _URL_RE.sub("", self.content).strip()
 
 
 class WhatsAppParser:
     """Parser for WhatsApp chat export files"""
     
-    # Common WhatsApp export patterns
-    # Format: [DD/MM/YYYY, HH:MM:SS] Sender: Message
-    # or: DD/MM/YYYY, HH:MM - Sender: Message
-    MESSAGE_PATTERNS = [
-        r'\[(\d{1,2}/\d{1,2}/\d{2,4}),\s*(\d{1,2}:\d{2}(?::\d{2})?(?:\s*[AP]M)?)\]\s*([^:]+):\s*(.*)',
-        r'(\d{1,2}/\d{1,2}/\d{2,4}),\s*(\d{1,2}:\d{2}(?::\d{2})?(?:\s*[AP]M)?)\s*-\s*([^:]+):\s*(.*)',
-    ]
-    
-    # URL pattern
-    URL_PATTERN = r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
-    
     def __init__(self):
         self.messages: List[WhatsAppMessage] = []
     
     def parse_file(self, file_path: str) -> List[WhatsAppMessage]:
-        """Parse a WhatsApp export file"""
+        """Parse a WhatsApp export file, streaming it line by line"""
         with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        return self.parse_content(content)
+            return self._parse_lines(_iter_lines(f))
     
     def parse_content(self, content: str) -> List[WhatsAppMessage]:
         """Parse WhatsApp chat content"""
+        return self._parse_lines(_iter_lines(io.StringIO(content, newline='\n')))
+    
+    def _parse_lines(self, lines: Iterable[str]) -> List[WhatsAppMessage]:
+        """Group export lines into messages"""
         messages = []
         current_message = None
-        
-        lines = content.split('\n')
+        current_lines = []  # joined once when the message is complete
         
         for line in lines:
-            # Try to match message start pattern
-            parsed = self._parse_message_line(line)
+            # Try to match message start pattern (cheap first-char check first)
+            parsed = self._parse_message_line(line) if line[:1] in _MESSAGE_START_CHARS else None
             
             if parsed:
                 # Save previous message if exists
                 if current_message:
+                    current_message.content = "\n".join(current_lines)
                     messages.append(current_message)
                 
                 # Start new message
@@ -82,14 +132,15 @@ class WhatsAppParser:
                     content=message_content,
                     urls=urls
                 )
+                current_lines = [message_content]
             elif current_message:
                 # Continuation of previous message (multi-line)
-                current_message.content += "\n" + line
-                urls = self._extract_urls(line)
-                current_message.urls.extend(urls)
+                current_lines.append(line)
+                current_message.urls.extend(self._extract_urls(line))
         
         # Don't forget the last message
         if current_message:
+            current_message.content = "\n".join(current_lines)
             messages.append(current_message)
         
         self.messages = messages
@@ -97,30 +148,34 @@ class WhatsAppParser:
     
     def _parse_message_line(self, line: str) -> Optional[Tuple[str, str, str, str]]:
         """Try to parse a message line with different patterns"""
-        for pattern in self.MESSAGE_PATTERNS:
-            match = re.match(pattern, line)
+        for message_re in _MESSAGE_RES:
+            match = message_re.match(line)
             if match:
                 return match.groups()
         return None
     
     def _extract_urls(self, text: str) -> List[str]:
         """Extract all URLs from text"""
-        return re.findall(self.URL_PATTERN, text)
+        return _URL_RE.findall(text)
     
     def get_url_type(self, url: str) -> str:
         """Determine the type of URL"""
-        url_lower = url.lower()
+        try:
+            host = urlparse(url).hostname or ''
+        except ValueError:
+            # Stray brackets from the message text (e.g. "[https://x.com]")
+            host = ''
         
-        if 'twitter.com' in url_lower or 'x.com' in url_lower:
-            return 'tweet'
-        elif 'linkedin.com' in url_lower:
-            return 'linkedin'
-        elif 'youtube.com' in url_lower or 'youtu.be' in url_lower:
-            return 'video'
-        elif any(domain in url_lower for domain in ['medium.com', 'substack.com', 'blog']):
+        # Look up the host and each parent domain (foo.substack.com -> substack.com)
+        labels = host.split('.')
+        for i in range(len(labels) - 1):
+            url_type = _DOMAIN_TYPES.get('.'.join(labels[i:]))
+            if url_type:
+                return url_type
+        
+        if 'blog' in url.lower():
             return 'article'
-        else:
-            return 'link'
+        return 'link'
     
     def extract_insights(self) -> List[Dict]:
         """Extract structured insights from parsed messages"""
@@ -159,18 +214,7 @@ class WhatsAppParser:
     
     def _is_system_message(self, msg: WhatsAppMessage) -> bool:
         """Check if message is a system message"""
-        system_keywords = [
-            'Messages and calls are end-to-end encrypted',
-            'created group',
-            'changed the subject',
-            'left',
-            'added',
-            'removed',
-            'changed this group',
-            'You deleted this message',
-            'This message was deleted'
-        ]
-        return any(keyword in msg.content for keyword in system_keywords)
+        return _SYSTEM_RE.search(msg.content) is not None
     
     def _is_meaningful_content(self, content: str) -> bool:
         """Check if content is meaningful enough to be an insight"""
@@ -179,27 +223,28 @@ class WhatsAppParser:
             return False
         
         # Filter out messages that are just reactions or short responses
-        short_responses = ['ok', 'yes', 'no', 'thanks', 'lol', 'haha', '😂', '👍', 'nice', 'cool']
-        if content.strip().lower() in short_responses:
+        if content.strip().lower() in _SHORT_RESPONSES:
             return False
         
         return True
     
     def get_statistics(self) -> Dict:
         """Get parsing statistics"""
-        total_messages = len(self.messages)
-        messages_with_urls = sum(1 for msg in self.messages if msg.urls)
-        total_urls = sum(len(msg.urls) for msg in self.messages)
+        messages_with_urls = total_urls = 0
+        senders = Counter()
         
-        # Count by sender
-        senders = {}
+        # One pass over the messages: URL counts and messages per sender
         for msg in self.messages:
-            senders[msg.sender] = senders.get(msg.sender, 0) + 1
+            url_count = len(msg.urls)
+            total_urls += url_count
+            if url_count:
+                messages_with_urls += 1
+            senders[msg.sender] += 1
         
         return {
-            'total_messages': total_messages,
+            'total_messages': len(self.messages),
             'messages_with_urls': messages_with_urls,
             'total_urls': total_urls,
             'unique_senders': len(senders),
-            'top_senders': dict(sorted(senders.items(), key=lambda x: x[1], reverse=True)[:10])
+            'top_senders': dict(senders.most_common(10))
         }
@@ -4,16 +4,235 @@ Adds users, subscriptions, usage_log, referrals; adds user_id/share_hash where n
 """
 import sqlite3
 import os
+from database import migrate_content_hash
 
 DB_PATH = os.path.join(os.path.dirname(__file__), 'braingym.db')
 
-def column_exists(cursor, table, column):
+# insights.tags is a CSV string (or a JSON array); as a JSON array for json_each
+TAGS_JSON_SQL = """
+    CASE WHEN json_valid({tags}) AND json_type({tags}) = 'array' THEN {tags}
+    ELSE '["' || replace(replace(replace({tags}, '\\', ''), '"', ''), ',', '","') || '"]'
+    END
+"""
+
+# Columns indexed by insights_fts, in bm25() weight order (see search_engine)
+FTS_COLUMNS = ('content', 'extracted_text', 'context_message', 'tags')
+
+
+def tag_rows_sql(insight_id, tags, source=''):
+    """SELECT of (insight_id, tag) rows, one per tag in the tags column"""
+    tags_json = TAGS_JSON_SQL.format(tags=tags)
+    return f"""
+        SELECT {insight_id} AS insight_id, TRIM(value) AS tag FROM {source} json_each({tags_json})
+        WHERE {tags} IS NOT NULL AND {tags} != '' AND json_valid({tags_json})
+        AND TRIM(value) != ''
+    """
+
+
+def domain_sql(url):
+    """
+    SQL expression for the host of a URL: lowercased, without userinfo,
+    port or a leading www. (https://user@www.Foo.com:8080/x -> foo.com)
+    """
+    return f"""(
+        SELECT CASE WHEN h LIKE 'www.%' THEN NULLIF(substr(h, 5), '') ELSE NULLIF(h, '') END
+        FROM (SELECT lower(substr(hp, 1, instr(hp || ':', ':') - 1)) AS h
+        FROM (SELECT substr(a, length(rtrim(a, replace(a, '@', ''))) + 1) AS hp
+        FROM (SELECT substr(r, 1, instr(r, '/') - 1) AS a
+        FROM (SELECT replace(replace(substr({url}, instr({url}, '://') + 3),
+                     '?', '/'), '#', '/') || '/' AS r
+              WHERE instr({url}, '://') > 0))))
+    )"""
+
+
+# Second-level labels under which ccTLD sites register (bbc.co.uk, abc.net.au)
+_SECOND_LEVEL_LABELS = "'co', 'com', 'org', 'net', 'ac', 'gov', 'edu'"
+
+
+def site_sql(host):
+    """
+    SQL expression for the site a host belongs to: its last two labels, or
+    three under a ccTLD second level (mobile.twitter.com -> twitter.com,
+    news.bbc.co.uk -> bbc.co.uk)
+    """
+    return f"""(
+        SELECT CASE WHEN tld GLOB '[0-9]*' THEN h  -- IP address
+                    WHEN length(tld) = 2 AND sld IN ({_SECOND_LEVEL_LABELS})
+                    THEN substr(h, length(rtrim(q, replace(q, '.', ''))) + 1)
+                    ELSE substr(h, i2 + 1) END
+        FROM (SELECT h, tld, i2, substr(p, i2 + 1) AS sld, substr(p, 1, max(i2 - 1, 0)) AS q
+        FROM (SELECT h, tld, p, length(rtrim(p, replace(p, '.', ''))) AS i2
+        FROM (SELECT h, substr(h, i1 + 1) AS tld, substr(h, 1, max(i1 - 1, 0)) AS p
+        FROM (SELECT h, length(rtrim(h, replace(h, '.', ''))) AS i1
+        FROM (SELECT {host} AS h)))))
+    )"""
+
+
+def migrate_domain(cursor):
+    """
+    Add insights.domain (the host) and insights.site (its registrable site),
+    both indexed and kept in sync with source_url by triggers
+    """
+    insight_columns = table_columns(cursor, 'insights')
+    if 'source_url' not in insight_columns:
+        return
+    if 'domain' not in insight_columns:
+        cursor.execute('ALTER TABLE insights ADD COLUMN domain TEXT')
+        cursor.execute(f"UPDATE insights SET domain = {domain_sql('source_url')}")
+    if 'site' not in insight_columns:
+        cursor.execute('ALTER TABLE insights ADD COLUMN site TEXT')
+        cursor.execute(f"UPDATE insights SET site = {site_sql('domain')}")
+        # Triggers from before the site column only set domain
+        cursor.execute('DROP TRIGGER IF EXISTS insights_domain_ai')
+        cursor.execute('DROP TRIGGER IF EXISTS insights_domain_au')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_insights_domain ON insights(domain)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_insights_site ON insights(site)')
+    new_domain = domain_sql('NEW.source_url')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS insights_domain_ai AFTER INSERT ON insights
+        BEGIN
+            UPDATE insights SET domain = {new_domain}, site = {site_sql(new_domain)}
+            WHERE id = NEW.id;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS insights_domain_au AFTER UPDATE OF source_url ON insights
+        BEGIN
+            UPDATE insights SET domain = {new_domain}, site = {site_sql(new_domain)}
+            WHERE id = NEW.id;
+        END
+    ''')
+
+
+def migrate_ext_len(cursor):
+    """Add insights.ext_len, a virtual generated (and indexed) LENGTH of extracted_text"""
+    # table_info hides generated columns, table_xinfo does not
+    cursor.execute("PRAGMA table_xinfo(insights)")
+    insight_columns = {row[1] for row in cursor.fetchall()}
+    if 'extracted_text' not in insight_columns:
+        return
+    if 'ext_len' not in insight_columns:
+        cursor.execute("""
+            ALTER TABLE insights ADD COLUMN ext_len INTEGER
+            GENERATED ALWAYS AS (LENGTH(COALESCE(extracted_text, ''))) VIRTUAL
+        """)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_insights_ext_len ON insights(ext_len)')
+
+
+def migrate_responses_fts(cursor):
+    """Add responses_fts, a full-text index over responses.response_text (synced by triggers)"""
+    if 'response_text' not in table_columns(cursor, 'responses'):
+        return
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'responses_fts'")
+    rebuild = cursor.fetchone() is None
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS responses_fts USING fts5(
+            response_text, content='responses', content_rowid='id', tokenize='porter unicode61'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS responses_fts_ai AFTER INSERT ON responses
+        BEGIN
+            INSERT INTO responses_fts (rowid, response_text) VALUES (NEW.id, NEW.response_text);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS responses_fts_ad AFTER DELETE ON responses
+        BEGIN
+            INSERT INTO responses_fts (responses_fts, rowid, response_text) VALUES ('delete', OLD.id, OLD.response_text);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS responses_fts_au AFTER UPDATE OF response_text ON responses
+        BEGIN
+            INSERT INTO responses_fts (responses_fts, rowid, response_text) VALUES ('delete', OLD.id, OLD.response_text);
+            INSERT INTO responses_fts (rowid, response_text) VALUES (NEW.id, NEW.response_text);
+        END
+    ''')
+    if rebuild:
+        cursor.execute("INSERT INTO responses_fts (responses_fts) VALUES ('rebuild')")
+
+
+def migrate_tag_counts(cursor):
+    """
+    Add tag_counts, responses per tag of the responded insight (the top themes),
+    kept current by triggers on responses and insight_tags
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'insight_tags'")
+    if cursor.fetchone() is None or 'insight_id' not in table_columns(cursor, 'responses'):
+        return
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tag_counts'")
+    backfill = cursor.fetchone() is None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tag_counts (
+            tag TEXT PRIMARY KEY,
+            c INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tag_counts_c ON tag_counts(c DESC, tag)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_responses_insight ON responses(insight_id)')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tag_counts_responses_ai AFTER INSERT ON responses
+        BEGIN
+            INSERT INTO tag_counts (tag, c)
+            SELECT tag, 1 FROM insight_tags WHERE insight_id = NEW.insight_id
+            ON CONFLICT(tag) DO UPDATE SET c = c + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tag_counts_responses_ad AFTER DELETE ON responses
+        BEGIN
+            UPDATE tag_counts SET c = c - 1
+            WHERE tag IN (SELECT tag FROM insight_tags WHERE insight_id = OLD.insight_id);
+            DELETE FROM tag_counts WHERE c <= 0;
+        END
+    ''')
+    # Retagging a responded insight moves its responses to the new tags
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tag_counts_tags_ai AFTER INSERT ON insight_tags
+        WHEN EXISTS (SELECT 1 FROM responses WHERE insight_id = NEW.insight_id)
+        BEGIN
+            INSERT INTO tag_counts (tag, c)
+            SELECT NEW.tag, COUNT(*) FROM responses WHERE insight_id = NEW.insight_id
+            ON CONFLICT(tag) DO UPDATE SET c = c + excluded.c;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tag_counts_tags_ad AFTER DELETE ON insight_tags
+        WHEN EXISTS (SELECT 1 FROM responses WHERE insight_id = OLD.insight_id)
+        BEGIN
+            UPDATE tag_counts
+            SET c = c - (SELECT COUNT(*) FROM responses WHERE insight_id = OLD.insight_id)
+            WHERE tag = OLD.tag;
+            DELETE FROM tag_counts WHERE c <= 0;
+        END
+    ''')
+    if backfill:
+        cursor.execute('''
+            INSERT INTO tag_counts (tag, c)
+            SELECT t.tag, COUNT(*) FROM responses r
+            JOIN insight_tags t ON t.insight_id = r.insight_id
+            GROUP BY t.tag
+        ''')
+
+
+def table_columns(cursor, table):
     cursor.execute(f"PRAGMA table_info({table})")
-    return any(row[1] == column for row in cursor.fetchall())
+    return {row[1] for row in cursor.fetchall()}
 
 def run_migration():
     conn = sqlite3.connect(DB_PATH)
+    try:
+        _migrate(conn)
+    finally:
+        conn.close()  # Rolls back a step that failed part-way
+    print("✓ PLG database migration complete")
+
+def _migrate(conn):
     cursor = conn.cursor()
+    # Two transactions (DDL included): the core schema the app reads and writes
+    # commits first, so a failing derived index/FTS step below can't roll it back
+    cursor.execute('BEGIN')
 
     # 1. Users table
     cursor.execute('''
@@ -75,47 +294,56 @@ def run_migration():
         )
     ''')
 
+    # Schema is only changed by us below; read each table's columns once
+    columns = {
+        table: table_columns(cursor, table)
+        for table in ('voice_profile', 'generations', 'insights', 'users')
+    }
+
     # 5. Add user_id to voice_profile if missing
-    if not column_exists(cursor, 'voice_profile', 'user_id'):
+    if 'user_id' not in columns['voice_profile']:
         try:
             cursor.execute('ALTER TABLE voice_profile ADD COLUMN user_id INTEGER')
         except sqlite3.OperationalError:
             pass
 
     # 6. Add user_id and share_hash to generations if missing
-    if not column_exists(cursor, 'generations', 'user_id'):
+    if 'user_id' not in columns['generations']:
         try:
             cursor.execute('ALTER TABLE generations ADD COLUMN user_id INTEGER')
         except sqlite3.OperationalError:
             pass
-    if not column_exists(cursor, 'generations', 'share_hash'):
+    if 'share_hash' not in columns['generations']:
         try:
             cursor.execute('ALTER TABLE generations ADD COLUMN share_hash TEXT')
         except sqlite3.OperationalError:
             pass
 
     # 7. Conversion engine: trial_key on insights, onboarding/testimonial on users
-    if not column_exists(cursor, 'insights', 'trial_key'):
+    if 'trial_key' not in columns['insights']:
         try:
             cursor.execute('ALTER TABLE insights ADD COLUMN trial_key TEXT')
         except sqlite3.OperationalError:
             pass
-    if not column_exists(cursor, 'insights', 'user_id'):
+    if 'user_id' not in columns['insights']:
         try:
             cursor.execute('ALTER TABLE insights ADD COLUMN user_id INTEGER')
         except sqlite3.OperationalError:
             pass
-    if not column_exists(cursor, 'users', 'onboarding_completed'):
+    if 'onboarding_completed' not in columns['users']:
         try:
             cursor.execute('ALTER TABLE users ADD COLUMN onboarding_completed INTEGER DEFAULT 0')
         except sqlite3.OperationalError:
             pass
-    if not column_exists(cursor, 'users', 'testimonial_requested'):
+    if 'testimonial_requested' not in columns['users']:
         try:
             cursor.execute('ALTER TABLE users ADD COLUMN testimonial_requested INTEGER DEFAULT 0')
         except sqlite3.OperationalError:
             pass
 
+    # Dedup hash that content_app's inserts fill in (database.insert_insight_row)
+    migrate_content_hash(cursor)
+
     # 8. Testimonials table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS testimonials (
@@ -131,9 +359,167 @@ def run_migration():
         )
     ''')
 
+    # 9. Syntheses saved by the query engine, linked to the insights they cite
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS syntheses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            query TEXT NOT NULL,
+            synthesis_text TEXT NOT NULL,
+            source_insights TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            edited_text TEXT
+        )
+    ''')
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'synthesis_insights'")
+    backfill_links = cursor.fetchone() is None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS synthesis_insights (
+            synthesis_id INTEGER NOT NULL,
+            insight_id INTEGER NOT NULL,
+            PRIMARY KEY (synthesis_id, insight_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_si_ins ON synthesis_insights(insight_id)')
+    if backfill_links:
+        cursor.execute('''
+            INSERT OR IGNORE INTO synthesis_insights (synthesis_id, insight_id)
+            SELECT s.id, j.value FROM syntheses s, json_each(s.source_insights) j
+            WHERE json_valid(s.source_insights) AND json_type(s.source_insights) = 'array'
+            AND j.type = 'integer'
+        ''')
+
+    conn.commit()
+    cursor.execute('BEGIN')
+
+    # 10. Indexes for per-user lookups and the library stats queries
+    indexes = [
+        'CREATE INDEX IF NOT EXISTS idx_usage_log_user ON usage_log(user_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_referrals_referrer ON referrals(referrer_id)',
+        'CREATE INDEX IF NOT EXISTS idx_subs_user ON subscriptions(user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_testimonials_user ON testimonials(user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_generations_user ON generations(user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_generations_share ON generations(share_hash)',
+        'CREATE INDEX IF NOT EXISTS idx_syntheses_user ON syntheses(user_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_insights_user ON insights(user_id, useful_for_daily)',
+        'CREATE INDEX IF NOT EXISTS idx_insights_cat ON insights(content_category) WHERE useful_for_daily = 1',
+        # BrainGymUtils.get_stats counts, answered from the index alone
+        'CREATE INDEX IF NOT EXISTS idx_insights_useful_cat_status ON insights(useful_for_daily, content_category, status)',
+        # BrainGymUtils streak and response listing
+        'CREATE INDEX IF NOT EXISTS idx_responses_created ON responses(created_at)',
+        # BrainGymUtils.get_daily_three candidates, already in quality order
+        "CREATE INDEX IF NOT EXISTS idx_insights_daily ON insights(quality_score DESC, last_shown_date) WHERE status = 'pending' AND useful_for_daily = 1 AND is_duplicate = 0",
+        # search_engine / smart_extractor scans
+        "CREATE INDEX IF NOT EXISTS idx_insights_pending ON insights(content_category, source_url) WHERE extraction_status = 'pending'",
+        "CREATE INDEX IF NOT EXISTS idx_insights_tagged ON insights(content_category) WHERE useful_for_daily = 1 AND tags IS NOT NULL AND tags != ''",
+        'CREATE INDEX IF NOT EXISTS idx_insights_cat_quality ON insights(content_category, quality_score DESC)',
+    ]
+    for statement in indexes:
+        try:
+            cursor.execute(statement)
+        except sqlite3.OperationalError:
+            pass  # Table or column not in this database yet
+
+    # 11. Normalized tags, kept in sync with insights.tags by triggers
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'insight_tags'")
+    backfill_tags = cursor.fetchone() is None and 'tags' in columns['insights']
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS insight_tags (
+            insight_id INTEGER NOT NULL,
+            tag TEXT NOT NULL,
+            PRIMARY KEY (insight_id, tag)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_insight_tags_tag ON insight_tags(tag)')
+    if 'tags' in columns['insights']:
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS insights_tags_ai AFTER INSERT ON insights
+            BEGIN
+                INSERT OR IGNORE INTO insight_tags (insight_id, tag)
+                {tag_rows_sql('NEW.id', 'NEW.tags')};
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS insights_tags_au AFTER UPDATE OF tags ON insights
+            BEGIN
+                DELETE FROM insight_tags WHERE insight_id = OLD.id;
+                INSERT OR IGNORE INTO insight_tags (insight_id, tag)
+                {tag_rows_sql('NEW.id', 'NEW.tags')};
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS insights_tags_ad AFTER DELETE ON insights
+            BEGIN
+                DELETE FROM insight_tags WHERE insight_id = OLD.id;
+            END
+        ''')
+    if backfill_tags:
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO insight_tags (insight_id, tag)
+            {tag_rows_sql('insights.id', 'insights.tags', source='insights,')}
+        ''')
+
+    # 12. Every writer stores tags as "a,b,c"; rewrite any JSON-array stragglers
+    if 'tags' in columns['insights']:
+        cursor.execute('''
+            UPDATE insights
+            SET tags = (SELECT group_concat(TRIM(value), ',') FROM json_each(insights.tags))
+            WHERE tags LIKE '[%' AND json_valid(tags) AND json_type(tags) = 'array'
+        ''')
+
+    # 13. Full-text index for ContentSearchEngine.search (external content, synced by triggers)
+    if set(FTS_COLUMNS) <= columns['insights']:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'insights_fts'")
+        rebuild_fts = cursor.fetchone() is None
+        fts_cols = ', '.join(FTS_COLUMNS)
+        new_cols = ', '.join(f'NEW.{c}' for c in FTS_COLUMNS)
+        old_cols = ', '.join(f'OLD.{c}' for c in FTS_COLUMNS)
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS insights_fts USING fts5(
+                {fts_cols}, content='insights', content_rowid='id', tokenize='porter unicode61'
+            )
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS insights_fts_ai AFTER INSERT ON insights
+            BEGIN
+                INSERT INTO insights_fts (rowid, {fts_cols}) VALUES (NEW.id, {new_cols});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS insights_fts_ad AFTER DELETE ON insights
+            BEGIN
+                INSERT INTO insights_fts (insights_fts, rowid, {fts_cols}) VALUES ('delete', OLD.id, {old_cols});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS insights_fts_au AFTER UPDATE OF {fts_cols} ON insights
+            BEGIN
+                INSERT INTO insights_fts (insights_fts, rowid, {fts_cols}) VALUES ('delete', OLD.id, {old_cols});
+                INSERT INTO insights_fts (rowid, {fts_cols}) VALUES (NEW.id, {new_cols});
+            END
+        ''')
+        if rebuild_fts:
+            cursor.execute("INSERT INTO insights_fts (insights_fts) VALUES ('rebuild')")
+
+    # 14. Host and site per insight, so URL filters are index lookups instead of LIKE '%...%'
+    migrate_domain(cursor)
+
+    # 15. Extracted-text length as an indexed column for length-gated queries
+    migrate_ext_len(cursor)
+
+    # 16. Full-text index over Brain Gym responses for BrainGymUtils.search_responses
+    migrate_responses_fts(cursor)
+
+    # 17. Per-tag response counts for BrainGymUtils.get_stats' top themes
+    migrate_tag_counts(cursor)
+
+    conn.commit()
+
+    # Planner statistics for the indexes above: full ANALYZE the first time,
+    # afterwards only where SQLite thinks they're stale
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+    cursor.execute('ANALYZE' if cursor.fetchone() is None else 'PRAGMA optimize')
     conn.commit()
-    conn.close()
-    print("✓ PLG database migration complete")
 
 if __name__ == '__main__':
     run_migration()
@@ -1,11 +1,15 @@
 """
 Query engine: classify and route queries to recall, synthesis, pattern, decision, generate, explore.
 """
+import asyncio
+import functools
 import json
-import re
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional
-from collections import Counter
 
 try:
     import anthropic
@@ -14,6 +18,47 @@ except ImportError:
     HAS_ANTHROPIC = False
 
 from embeddings import EmbeddingEngine
+from plg_migrate import tag_rows_sql
+
+STATS_TTL = 60  # seconds; library counts change at human timescale
+SEARCH_CACHE_SIZE = 128
+_JSON_DECODER = json.JSONDecoder()
+QUERY_TYPES = ("recall", "synthesis", "pattern", "decision", "generate", "explore")
+
+# Forced tool call so classify_query gets structured input back instead of prose
+CLASSIFY_TOOL = {
+    "name": "classify",
+    "description": "Record the query type and intent.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "type": {"type": "string", "enum": list(QUERY_TYPES)},
+            "intent": {"type": "string"},
+            "key_concepts": {"type": "array", "items": {"type": "string"}},
+            "timeframe": {"type": "string", "enum": ["recent", "all_time", "specific_date"]},
+            "output_format": {"type": "string", "enum": ["text", "list", "framework", "content"]}
+        },
+        "required": ["type", "intent"]
+    }
+}
+
+# Blocking API/DB calls run here so route_query_async can overlap them. Shared
+# across requests, unlike the default executor each asyncio.run sets up and tears down.
+_EXECUTOR = ThreadPoolExecutor(max_workers=8)
+
+
+def _in_thread(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(_EXECUTOR, functools.partial(func, *args, **kwargs))
+
+
+def split_tags(tags) -> List[str]:
+    """insights.tags is stored as "a,b,c" (see plg_migrate); lists pass through."""
+    if not tags:
+        return []
+    if isinstance(tags, str):
+        return [t.strip() for t in tags.split(",") if t.strip()]
+    return list(tags)
 
 
 class QueryEngine:
@@ -27,6 +72,25 @@ class QueryEngine:
             self.client = anthropic.Anthropic(api_key=self.anthropic_key)
         self.embedding_engine = EmbeddingEngine(api_key=openai_key or __import__("os").environ.get("OPENAI_API_KEY"))
         self.db_path = "braingym.db"
+        self._conn = None
+        self._conn_lock = threading.Lock()
+        self._stats_cache = None  # (monotonic time, stats dict)
+        self._search_cache = OrderedDict()  # (query, user_id, trial_key) -> (monotonic time, results)
+        self._search_lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Long-lived connection shared by all requests (guarded by _conn_lock)."""
+        if self._conn is None:
+            # Autocommit: each statement is its own transaction, no implicit BEGIN
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.executescript("""
+                PRAGMA journal_mode=WAL;
+                PRAGMA synchronous=NORMAL;
+                PRAGMA temp_store=MEMORY;
+                PRAGMA mmap_size=268435456;
+            """)
+        return self._conn
 
     def classify_query(self, query: str) -> Dict:
         """
@@ -53,7 +117,7 @@ Classify as ONE of these types:
 5. generate - User wants to create content (post, article, etc.)
 6. explore - User wants to browse/discover what they know
 
-Return JSON only, no other text:
+Classify it with the classify tool:
 {{
     "type": "recall|synthesis|pattern|decision|generate|explore",
     "intent": "brief description of what user wants",
@@ -66,12 +130,17 @@ Return JSON only, no other text:
             response = self.client.messages.create(
                 model="claude-sonnet-4-20250514",
                 max_tokens=500,
+                tools=[CLASSIFY_TOOL],
+                tool_choice={"type": "tool", "name": "classify"},
                 messages=[{"role": "user", "content": prompt}]
             )
-            text = response.content[0].text
-            json_match = re.search(r'\{.*\}', text, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group())
+            for block in response.content:
+                if block.type == "tool_use":
+                    return block.input
+                if block.type == "text" and "{" in block.text:
+                    # Fallback: first JSON object in the reply, decoded without a regex scan
+                    text = block.text
+                    return _JSON_DECODER.raw_decode(text, text.index("{"))[0]
         except Exception as e:
             print(f"Query classification error: {e}")
         return {
@@ -89,15 +158,62 @@ Return JSON only, no other text:
         trial_key: Optional[str] = None
     ) -> Dict:
         """Main query router."""
-        classification = self.classify_query(query)
+        return asyncio.run(self.route_query_async(query, user_id=user_id, trial_key=trial_key))
+
+    async def route_query_async(
+        self,
+        query: str,
+        user_id: Optional[int] = None,
+        trial_key: Optional[str] = None
+    ) -> Dict:
+        """
+        Main query router. Classification and search run concurrently; the
+        handler starts once both are in.
+        """
+        classify_task = asyncio.ensure_future(_in_thread(self.classify_query, query))
+        search_task = asyncio.ensure_future(_in_thread(self._search, query, user_id, trial_key))
+        classification = await classify_task
         query_type = classification.get("type", "recall")
-        relevant_insights = self.embedding_engine.semantic_search(
+        if query_type not in QUERY_TYPES:
+            query_type = "recall"
+        relevant_insights = await search_task
+        return await _in_thread(
+            self._handle, query_type, query, relevant_insights, classification, user_id
+        )
+
+    def _search(self, query: str, user_id: Optional[int], trial_key: Optional[str]) -> List[Dict]:
+        """
+        Top 20 semantic matches (handlers slice what they need), cached briefly
+        so a repeated question skips the embedding API call and the table scan.
+        """
+        key = (query, user_id, trial_key)
+        with self._search_lock:
+            cached = self._search_cache.get(key)
+            if cached and time.monotonic() - cached[0] < STATS_TTL:
+                self._search_cache.move_to_end(key)
+                return cached[1]
+        results = self.embedding_engine.semantic_search(
             query,
             user_id=user_id,
             trial_key=trial_key,
             limit=20,
             db_path=self.db_path
         )
+        with self._search_lock:
+            self._search_cache[key] = (time.monotonic(), results)
+            self._search_cache.move_to_end(key)
+            if len(self._search_cache) > SEARCH_CACHE_SIZE:
+                self._search_cache.popitem(last=False)
+        return results
+
+    def _handle(
+        self,
+        query_type: str,
+        query: str,
+        relevant_insights: List[Dict],
+        classification: Dict,
+        user_id: Optional[int] = None
+    ) -> Dict:
         if query_type == "recall":
             return self.handle_recall(query, relevant_insights, classification)
         if query_type == "synthesis":
@@ -358,15 +474,9 @@ Be enthusiastic and help them rediscover their own knowledge.
                 part += f"Saved: {shared[:10]}\n"
             if insight.get("source_url"):
                 part += f"Source: {insight['source_url']}\n"
-            tags = insight.get("tags")
+            tags = split_tags(insight.get("tags"))
             if tags:
-                if isinstance(tags, str):
-                    try:
-                        tags = json.loads(tags) if tags.strip().startswith("[") else [t.strip() for t in tags.split(",")]
-                    except Exception:
-                        tags = [t.strip() for t in tags.split(",")]
-                if tags:
-                    part += f"Tags: {', '.join(str(t) for t in (tags[:5] if isinstance(tags, list) else []))}\n"
+                part += f"Tags: {', '.join(str(t) for t in tags[:5])}\n"
             part += "\nContent:\n"
             text = insight.get("extracted_text") or insight.get("content") or ""
             if len(text) > 1500:
@@ -383,81 +493,79 @@ Be enthusiastic and help them rediscover their own knowledge.
         user_id: Optional[int] = None
     ) -> int:
         """Save synthesis to database."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS syntheses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                query TEXT NOT NULL,
-                synthesis_text TEXT NOT NULL,
-                source_insights TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                edited_text TEXT
-            )
-        """)
-        cursor.execute(
-            """
-            INSERT INTO syntheses (user_id, query, synthesis_text, source_insights)
-            VALUES (?, ?, ?, ?)
-            """,
-            (user_id, query, synthesis_text, json.dumps(insights))
-        )
-        sid = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        # syntheses/synthesis_insights are created by plg_migrate.run_migration
+        with self._conn_lock:
+            conn = self._connection()
+            conn.execute("BEGIN")
+            try:
+                cursor = conn.execute(
+                    """
+                    INSERT INTO syntheses (user_id, query, synthesis_text, source_insights)
+                    VALUES (?, ?, ?, ?)
+                    """,
+                    (user_id, query, synthesis_text, json.dumps(insights))
+                )
+                sid = cursor.lastrowid
+                conn.executemany(
+                    "INSERT OR IGNORE INTO synthesis_insights (synthesis_id, insight_id) VALUES (?, ?)",
+                    [(sid, insight_id) for insight_id in insights]
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
         return sid
 
     def _get_library_stats(self) -> Dict:
-        """Get statistics about the library."""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) as total FROM insights WHERE useful_for_daily = 1")
-        total = cursor.fetchone()["total"]
-        cursor.execute("""
-            SELECT content_category, COUNT(*) as count
-            FROM insights WHERE useful_for_daily = 1
-            GROUP BY content_category
-        """)
-        categories = {row["content_category"]: row["count"] for row in cursor.fetchall()}
-        cursor.execute("""
-            SELECT tags FROM insights
-            WHERE useful_for_daily = 1 AND tags IS NOT NULL AND tags != ''
-        """)
-        all_tags = []
-        for row in cursor.fetchall():
-            t = row["tags"]
+        """Get statistics about the library (cached for STATS_TTL seconds)."""
+        cached = self._stats_cache
+        if cached and time.monotonic() - cached[0] < STATS_TTL:
+            return cached[1]
+        with self._conn_lock:
+            cursor = self._connection().cursor()
+            cursor.execute("""
+                SELECT content_category, COUNT(*) as count
+                FROM insights WHERE useful_for_daily = 1
+                GROUP BY content_category
+            """)
+            categories = {row["content_category"]: row["count"] for row in cursor.fetchall()}
+            # insight_tags is maintained from insights.tags by plg_migrate triggers
+            top_tags_sql = """
+                SELECT t.tag, COUNT(*) as count
+                FROM {tags} t JOIN insights i ON i.id = t.insight_id
+                WHERE i.useful_for_daily = 1
+                GROUP BY t.tag
+                ORDER BY count DESC, t.tag
+                LIMIT 10
+            """
             try:
-                if isinstance(t, str) and t.strip().startswith("["):
-                    all_tags.extend(json.loads(t))
-                else:
-                    all_tags.extend([x.strip() for x in str(t).split(",") if x.strip()])
-            except Exception:
-                all_tags.extend([x.strip() for x in str(t).split(",") if x.strip()])
-        tag_counts = Counter(all_tags)
-        top_topics = [tag for tag, _ in tag_counts.most_common(10)]
-        conn.close()
-        return {
-            "total": total,
+                cursor.execute(top_tags_sql.format(tags="insight_tags"))
+            except sqlite3.OperationalError:
+                # No insight_tags yet (migration not run); split insights.tags inline
+                tag_rows = tag_rows_sql("insights.id", "insights.tags", source="insights,")
+                cursor.execute(top_tags_sql.format(tags=f"({tag_rows})"))
+            top_topics = [row["tag"] for row in cursor.fetchall()]
+        stats = {
+            "total": sum(categories.values()),
             "articles": categories.get("article", 0),
             "notes": categories.get("my_note", 0),
             "videos": categories.get("video", 0),
             "social": categories.get("social_reference", 0),
             "top_topics": top_topics
         }
+        self._stats_cache = (time.monotonic(), stats)
+        return stats
 
     def _get_diverse_sample(self, insights: List[Dict], n: int = 10) -> List[Dict]:
-        """Get diverse sample by category."""
-        by_category = {}
+        """Get diverse sample: at most 2 per category, in search order."""
+        counts = {}
+        sample = []
         for insight in insights:
             cat = insight.get("content_category") or "other"
-            if cat not in by_category:
-                by_category[cat] = []
-            by_category[cat].append(insight)
-        sample = []
-        for cat, items in by_category.items():
-            sample.extend(items[:2])
-            if len(sample) >= n:
-                break
-        return sample[:n]
+            c = counts.get(cat, 0)
+            if c < 2:
+                sample.append(insight)
+                counts[cat] = c + 1
+                if len(sample) >= n:
+                    break
+        return sample
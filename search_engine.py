@@ -2,10 +2,72 @@
 Content Search Engine
 Searches database for insights relevant to a topic
 """
+import functools
+import heapq
 import sqlite3
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterable, Iterator, Tuple
 import re
 from collections import Counter
+from itertools import chain
+from operator import itemgetter
+from plg_migrate import tag_rows_sql
+
+try:
+    import ahocorasick
+    HAS_AHOCORASICK = True
+except ImportError:
+    HAS_AHOCORASICK = False
+
+_WORD_RE = re.compile(r'\w+')
+_DOMAIN_RE = re.compile(r'https?://(?:www\.)?([^/?#]+)')
+_STOP_WORDS = frozenset({
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 
+    'for', 'of', 'with', 'by', 'from', 'is', 'are', 'was', 'were',
+    'be', 'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did',
+    'will', 'would', 'should', 'could', 'may', 'might', 'must',
+    'i', 'you', 'he', 'she', 'it', 'we', 'they', 'what', 'which',
+    'who', 'when', 'where', 'why', 'how', 'about', 'this', 'that'
+})
+
+# search() ranks this many candidates per requested result before picking for variety
+SEARCH_CANDIDATES = 3
+FETCH_BATCH = 1000
+
+# Columns of the fallback scan, fetched as plain tuples
+SCAN_COLUMNS = (
+    'id', 'content', 'source_url', 'source_type',
+    'content_category', 'tags', 'quality_score',
+    'extracted_text', 'extracted_metadata', 'context_message',
+)
+_SCAN_QUALITY = SCAN_COLUMNS.index('quality_score')
+_scan_fields = itemgetter(*(SCAN_COLUMNS.index(col) for col in (
+    'content', 'extracted_text', 'context_message', 'tags', 'quality_score', 'content_category'
+)))
+
+# Filter shared by the suggest_topics queries (insights alias i)
+TAGGED_INSIGHTS = """
+    i.useful_for_daily = 1
+    AND i.tags IS NOT NULL AND i.tags != ''
+    AND i.content_category NOT IN ('junk', 'personal')
+"""
+
+# insight_tags' rows split from insights.tags inline, for databases plg_migrate hasn't run on
+INLINE_TAG_ROWS = f"({tag_rows_sql('insights.id', 'insights.tags', source='insights,')})"
+
+# WAL, 80MB page cache, 256MB mmap, in-memory temp tables
+CONNECTION_PRAGMAS = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA cache_size=-80000;
+    PRAGMA mmap_size=268435456;
+    PRAGMA temp_store=MEMORY;
+"""
+
+
+
+def _split_tags(tags: Optional[str]) -> List[str]:
+    """insights.tags "a, b,c" -> ['a', 'b', 'c'] (only run on rows being returned)"""
+    return [t.strip() for t in tags.split(',')] if tags else []
 
 
 class ContentSearchEngine:
@@ -18,6 +80,7 @@ class ContentSearchEngine:
         """Get database connection"""
         conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row
+        conn.executescript(CONNECTION_PRAGMAS)
         return conn
     
     def search(self, topic: str, limit: int = 10) -> List[Dict]:
@@ -25,113 +88,154 @@ class ContentSearchEngine:
         Find relevant insights for a topic
         
         Algorithm:
-        1. Keyword matching in content, extracted_text, tags
-        2. Score by relevance
-        3. Return top N sorted by relevance * quality
-        4. Ensure variety
+        1. Full-text match of topic keywords in content, extracted_text,
+           context_message, tags (insights_fts, see plg_migrate)
+        2. Rank by BM25 (tags weighted highest) * quality inside SQLite
+        3. Return top N, ensuring variety among the best candidates
         """
+        keywords = self._extract_keywords(topic)
+        if not keywords:
+            return self._search_scan(topic, keywords, limit)
+        
+        # Prefix terms so "market" still finds "marketing"
+        match = ' OR '.join(f'"{kw}"*' for kw in dict.fromkeys(keywords))
+        
         conn = self.get_connection()
         cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT 
+                    i.id, i.content, i.source_url, i.source_type,
+                    i.content_category, i.tags, i.quality_score,
+                    i.extracted_text, i.extracted_metadata,
+                    i.context_message,
+                    bm25(insights_fts, 1.0, 0.8, 0.6, 3.0) AS rel
+                FROM insights_fts
+                JOIN insights i ON i.id = insights_fts.rowid
+                WHERE insights_fts MATCH ?
+                AND i.useful_for_daily = 1
+                AND i.content_category NOT IN ('junk', 'personal')
+                ORDER BY rel * COALESCE(i.quality_score, 5)
+                LIMIT ?
+            """, (match, limit * SEARCH_CANDIDATES))
+        except sqlite3.OperationalError:
+            # Full-text index not built for this database yet
+            conn.close()
+            return self._search_scan(topic, keywords, limit)
+        
+        results = []
+        for row in cursor.fetchall():
+            insight = dict(row)
+            # bm25() is negative, more negative = better match
+            insight['relevance_score'] = -insight.pop('rel')
+            insight['tags'] = _split_tags(insight['tags'])
+            results.append(insight)
+        conn.close()
         
-        # Extract keywords from topic
-        keywords = self._extract_keywords(topic)
+        return self._ensure_variety(results, limit)
+    
+    def _search_scan(self, topic: str, keywords: Tuple[str, ...], limit: int) -> List[Dict]:
+        """Score every useful insight in Python (no full-text index available)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
         
-        # Search query
-        query = """
-            SELECT 
-                id, content, source_url, source_type,
-                content_category, tags, quality_score,
-                extracted_text, extracted_metadata,
-                context_message
+        # Search query; plain tuples are cheaper to fetch and unpack than Rows
+        query = f"""
+            SELECT {', '.join(SCAN_COLUMNS)}
             FROM insights
             WHERE useful_for_daily = 1
             AND content_category NOT IN ('junk', 'personal')
         """
         
+        cursor.row_factory = None
         cursor.execute(query)
-        all_insights = [dict(row) for row in cursor.fetchall()]
+        rows = iter(lambda: cursor.fetchmany(FETCH_BATCH), [])
+        
+        # Stream rows through a bounded min-heap of the best candidates by
+        # combined score (relevance * quality); earlier rows win ties
+        keep = limit * SEARCH_CANDIDATES
+        heap = []
+        scored = self._score_rows(chain.from_iterable(rows), topic, keywords)
+        for seq, (row, score) in enumerate(scored):
+            if score <= 0:  # Only include relevant items
+                continue
+            entry = (score * (row[_SCAN_QUALITY] or 5), -seq, score, row)
+            if len(heap) < keep:
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
         conn.close()
         
-        # Score each insight
+        # Only the kept rows are turned into dicts
         scored_insights = []
-        for insight in all_insights:
-            score = self._calculate_relevance(insight, topic, keywords)
-            if score > 0:  # Only include relevant items
-                insight['relevance_score'] = score
-                # Parse tags if string
-                if isinstance(insight['tags'], str) and insight['tags']:
-                    insight['tags'] = [t.strip() for t in insight['tags'].split(',')]
-                else:
-                    insight['tags'] = []
-                scored_insights.append(insight)
-        
-        # Sort by combined score (relevance * quality)
-        scored_insights.sort(
-            key=lambda x: x['relevance_score'] * (x['quality_score'] or 5),
-            reverse=True
-        )
+        for _, _, score, row in sorted(heap, key=lambda e: e[:2], reverse=True):
+            insight = dict(zip(SCAN_COLUMNS, row))
+            insight['relevance_score'] = score
+            insight['tags'] = _split_tags(insight['tags'])
+            scored_insights.append(insight)
         
         # Ensure variety
         final_results = self._ensure_variety(scored_insights, limit)
         
         return final_results
     
-    def _extract_keywords(self, text: str) -> List[str]:
-        """Extract keywords from text"""
-        # Convert to lowercase, split on whitespace/punctuation
-        words = re.findall(r'\w+', text.lower())
-        
-        # Filter out common words
-        stop_words = {
-            'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 
-            'for', 'of', 'with', 'by', 'from', 'is', 'are', 'was', 'were',
-            'be', 'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did',
-            'will', 'would', 'should', 'could', 'may', 'might', 'must',
-            'i', 'you', 'he', 'she', 'it', 'we', 'they', 'what', 'which',
-            'who', 'when', 'where', 'why', 'how', 'about', 'this', 'that'
-        }
-        
-        keywords = [w for w in words if w not in stop_words and len(w) > 2]
-        return keywords
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def _extract_keywords(text: str) -> Tuple[str, ...]:
+        """Extract keywords from text (cached; repeated topics skip the regex)"""
+        # Lowercase, split on whitespace/punctuation, drop common words
+        words = _WORD_RE.findall(text.lower())
+        return tuple(w for w in words if len(w) > 2 and w not in _STOP_WORDS)
     
-    def _calculate_relevance(self, insight: Dict, topic: str, keywords: List[str]) -> float:
-        """Calculate relevance score for an insight"""
-        score = 0.0
-        
-        # Combine all searchable text
-        searchable_text = ' '.join([
-            insight['content'] or '',
-            insight['extracted_text'] or '',
-            insight['context_message'] or '',
-            ' '.join(insight.get('tags', []) if isinstance(insight.get('tags'), list) else [])
-        ]).lower()
-        
-        # Exact phrase match (highest score)
-        if topic.lower() in searchable_text:
-            score += 5.0
-        
-        # Keyword matches
-        keyword_matches = sum(1 for kw in keywords if kw in searchable_text)
-        score += keyword_matches * 0.5
-        
-        # Tag matches (important!)
-        tags_str = str(insight.get('tags', '')).lower()
-        tag_matches = sum(1 for kw in keywords if kw in tags_str)
-        score += tag_matches * 2.0
-        
-        # Bonus for articles with full content
-        if insight.get('extracted_text') and len(insight['extracted_text']) > 500:
-            score += 1.0
-        
-        # Bonus for high quality
-        if insight.get('quality_score'):
-            score += insight['quality_score'] / 10.0
-        
-        # Bonus for user's own notes (often more valuable)
-        if insight.get('content_category') == 'my_note':
-            score += 1.5
-        
-        return score
+    def _keyword_matcher(self, keywords: Tuple[str, ...]):
+        """Return text -> set of keywords found in it (one Aho-Corasick pass when available)"""
+        if not HAS_AHOCORASICK or not keywords:
+            return lambda text: {kw for kw in keywords if kw in text}
+        automaton = ahocorasick.Automaton()
+        for kw in keywords:
+            automaton.add_word(kw, kw)
+        automaton.make_automaton()
+        return lambda text: {kw for _, kw in automaton.iter(text)}
+    
+    def _score_rows(self, rows: Iterable[tuple], topic: str,
+                    keywords: Tuple[str, ...]) -> Iterator[Tuple[tuple, float]]:
+        """Yield (row, relevance score) for each SCAN_COLUMNS row"""
+        topic_lower = topic.lower()
+        match_keywords = self._keyword_matcher(keywords)
+        for row in rows:
+            content, extracted, context, tags, quality, category = _scan_fields(row)
+            extracted = extracted or ''
+            
+            # Combine all searchable text
+            searchable_text = f"{content or ''} {extracted} {context or ''}".lower()
+            score = 0.0
+            
+            # Exact phrase match (highest score)
+            if topic_lower in searchable_text:
+                score += 5.0
+            
+            # Keyword matches
+            found = match_keywords(searchable_text)
+            score += sum(1 for kw in keywords if kw in found) * 0.5
+            
+            # Tag matches (important!)
+            if tags:
+                found = match_keywords(tags.lower())
+                score += sum(1 for kw in keywords if kw in found) * 2.0
+            
+            # Bonus for articles with full content
+            if len(extracted) > 500:
+                score += 1.0
+            
+            # Bonus for high quality
+            if quality:
+                score += quality / 10.0
+            
+            # Bonus for user's own notes (often more valuable)
+            if category == 'my_note':
+                score += 1.5
+            
+            yield row, score
     
     def _ensure_variety(self, insights: List[Dict], limit: int) -> List[Dict]:
         """Ensure variety in selected insights"""
@@ -139,6 +243,7 @@ class ContentSearchEngine:
             return insights
         
         selected = []
+        selected_ids = set()
         used_categories = set()
         used_domains = set()
         
@@ -153,131 +258,133 @@ class ContentSearchEngine:
             # Prefer items with different categories and domains
             if category not in used_categories or domain not in used_domains:
                 selected.append(insight)
+                selected_ids.add(insight['id'])
                 used_categories.add(category)
                 if domain:
                     used_domains.add(domain)
         
         # Fill remaining slots with highest scored items
-        while len(selected) < limit and len(selected) < len(insights):
-            for insight in insights:
-                if insight not in selected:
-                    selected.append(insight)
-                    if len(selected) >= limit:
-                        break
+        for insight in insights:
+            if len(selected) >= limit:
+                break
+            if insight['id'] not in selected_ids:
+                selected.append(insight)
+                selected_ids.add(insight['id'])
         
-        return selected[:limit]
+        return selected
     
-    def _extract_domain(self, url: str) -> Optional[str]:
-        """Extract domain from URL"""
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def _extract_domain(url: str) -> Optional[str]:
+        """Extract domain from URL (cached across searches)"""
         if not url:
             return None
-        try:
-            from urllib.parse import urlparse
-            parsed = urlparse(url)
-            domain = parsed.netloc.replace('www.', '')
-            return domain if domain else None
-        except:
-            return None
+        match = _DOMAIN_RE.match(url)
+        return match.group(1) if match else None
     
     def suggest_topics(self, limit: int = 5) -> List[Dict]:
         """
         Analyze library and suggest content ideas
         
         Returns topic suggestions based on clusters of related content
+        (tag counts come from insight_tags, see plg_migrate)
         """
         conn = self.get_connection()
         cursor = conn.cursor()
+        tag_table = self._tag_table(cursor)
         
-        # Get all useful insights with tags
-        cursor.execute("""
-            SELECT id, content, tags, quality_score, content_category
-            FROM insights
-            WHERE useful_for_daily = 1
-            AND tags IS NOT NULL AND tags != ''
-            AND content_category NOT IN ('junk', 'personal')
-        """)
-        
-        insights = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        # Analyze tag clusters
-        tag_groups = {}
-        for insight in insights:
-            tags = insight['tags'].split(',') if insight['tags'] else []
-            for tag in tags:
-                tag = tag.strip().lower()
-                if tag:
-                    if tag not in tag_groups:
-                        tag_groups[tag] = []
-                    tag_groups[tag].append(insight)
+        # Top tags with enough content
+        cursor.execute(f"""
+            SELECT LOWER(t.tag) AS tag, COUNT(DISTINCT i.id) AS count,
+                   AVG(COALESCE(i.quality_score, 5)) AS quality
+            FROM {tag_table} t
+            JOIN insights i ON i.id = t.insight_id
+            WHERE {TAGGED_INSIGHTS}
+            GROUP BY LOWER(t.tag)
+            HAVING count >= 3
+            ORDER BY count DESC, MIN(i.id)
+            LIMIT ?
+        """, (limit,))
         
-        # Find interesting combinations
         suggestions = []
-        
-        # Top tags with enough content
-        for tag, group in sorted(tag_groups.items(), key=lambda x: len(x[1]), reverse=True):
-            if len(group) >= 3 and len(suggestions) < limit:
-                avg_quality = sum(i.get('quality_score', 5) for i in group) / len(group)
-                
-                # Generate topic suggestion
-                topic_templates = [
-                    f"What I've learned about {tag}",
-                    f"Why {tag} matters more than you think",
-                    f"The {tag} mistakes I see everywhere",
-                    f"{tag.title()}: What nobody tells you",
-                    f"My contrarian take on {tag}"
-                ]
-                
-                suggestions.append({
-                    'topic': topic_templates[len(suggestions) % len(topic_templates)],
-                    'angle': f'Based on your saved insights about {tag}',
-                    'count': len(group),
-                    'quality': round(avg_quality, 1),
-                    'supporting_insights': [i['id'] for i in group[:5]],
-                    'preview': [i['content'][:100] + '...' for i in group[:3]]
-                })
+        for row in cursor.fetchall():
+            tag = row['tag']
+            group = self._tagged_insights(cursor, tag_table, (tag,), 5)
+            
+            # Generate topic suggestion
+            topic_templates = [
+                f"What I've learned about {tag}",
+                f"Why {tag} matters more than you think",
+                f"The {tag} mistakes I see everywhere",
+                f"{tag.title()}: What nobody tells you",
+                f"My contrarian take on {tag}"
+            ]
+            
+            suggestions.append({
+                'topic': topic_templates[len(suggestions) % len(topic_templates)],
+                'angle': f'Based on your saved insights about {tag}',
+                'count': row['count'],
+                'quality': round(row['quality'], 1),
+                'supporting_insights': [i['id'] for i in group],
+                'preview': [i['content'][:100] + '...' for i in group[:3]]
+            })
         
         # Find interesting tag combinations
         if len(suggestions) < limit:
-            tag_pairs = self._find_tag_combinations(insights, tag_groups)
-            for pair, group in tag_pairs[:limit - len(suggestions)]:
-                tag1, tag2 = pair
+            for row in self._find_tag_combinations(cursor, tag_table, limit - len(suggestions)):
+                tag1, tag2 = row['tag1'], row['tag2']
+                group = self._tagged_insights(cursor, tag_table, (tag1, tag2), 5)
                 suggestions.append({
                     'topic': f"The intersection of {tag1} and {tag2}",
                     'angle': f'Unique insights connecting these topics',
-                    'count': len(group),
-                    'quality': sum(i.get('quality_score', 5) for i in group) / len(group),
-                    'supporting_insights': [i['id'] for i in group[:5]],
+                    'count': row['count'],
+                    'quality': row['quality'],
+                    'supporting_insights': [i['id'] for i in group],
                     'preview': [i['content'][:100] + '...' for i in group[:2]]
                 })
         
+        conn.close()
         return suggestions[:limit]
     
-    def _find_tag_combinations(self, insights: List[Dict], tag_groups: Dict) -> List:
-        """Find interesting combinations of tags"""
-        combinations = {}
-        
-        for insight in insights:
-            tags = [t.strip().lower() for t in insight['tags'].split(',') if t.strip()]
-            if len(tags) >= 2:
-                # Look at pairs of tags
-                for i, tag1 in enumerate(tags):
-                    for tag2 in tags[i+1:]:
-                        pair = tuple(sorted([tag1, tag2]))
-                        if pair not in combinations:
-                            combinations[pair] = []
-                        combinations[pair].append(insight)
-        
-        # Return combinations with at least 3 insights
-        valid_combinations = [
-            (pair, group) for pair, group in combinations.items() 
-            if len(group) >= 3
-        ]
-        
-        # Sort by number of insights
-        valid_combinations.sort(key=lambda x: len(x[1]), reverse=True)
-        
-        return valid_combinations
+    def _tag_table(self, cursor) -> str:
+        """insight_tags, or INLINE_TAG_ROWS when this database has no insight_tags yet"""
+        try:
+            cursor.execute("SELECT 1 FROM insight_tags LIMIT 1")
+            return 'insight_tags'
+        except sqlite3.OperationalError:
+            return INLINE_TAG_ROWS
+    
+    def _tagged_insights(self, cursor, tag_table: str, tags: tuple, n: int) -> List[sqlite3.Row]:
+        """First n insights (by id) carrying every one of the given lowercase tags"""
+        placeholders = ','.join('?' * len(tags))
+        cursor.execute(f"""
+            SELECT i.id, i.content
+            FROM insights i
+            WHERE {TAGGED_INSIGHTS}
+            AND (SELECT COUNT(DISTINCT LOWER(t.tag)) FROM {tag_table} t
+                 WHERE t.insight_id = i.id AND LOWER(t.tag) IN ({placeholders})) = ?
+            ORDER BY i.id
+            LIMIT ?
+        """, (*tags, len(tags), n))
+        return cursor.fetchall()
+    
+    def _find_tag_combinations(self, cursor, tag_table: str, n: int) -> List[sqlite3.Row]:
+        """Find the n tag pairs shared by the most insights (at least 3)"""
+        cursor.execute(f"""
+            SELECT LOWER(t1.tag) AS tag1, LOWER(t2.tag) AS tag2,
+                   COUNT(DISTINCT i.id) AS count,
+                   AVG(COALESCE(i.quality_score, 5)) AS quality
+            FROM {tag_table} t1
+            JOIN {tag_table} t2
+                ON t2.insight_id = t1.insight_id AND LOWER(t1.tag) < LOWER(t2.tag)
+            JOIN insights i ON i.id = t1.insight_id
+            WHERE {TAGGED_INSIGHTS}
+            GROUP BY tag1, tag2
+            HAVING count >= 3
+            ORDER BY count DESC, MIN(i.id)
+            LIMIT ?
+        """, (n,))
+        return cursor.fetchall()
     
     def find_connections(self, insights: List[Dict]) -> Dict:
         """Find interesting connections between insights"""
@@ -2,11 +2,24 @@
 """
 Smart extraction strategy: Extract 100 best articles + prepare social references
 """
+import functools
 import sqlite3
 import json
 from datetime import datetime, timedelta
+from itertools import chain
 from typing import List, Dict
+from urllib.parse import urlparse
 from firecrawl_extractor import FirecrawlExtractor
+from plg_migrate import migrate_domain, migrate_ext_len, table_columns
+
+# WAL, 80MB page cache, 256MB mmap, in-memory temp tables
+CONNECTION_PRAGMAS = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA cache_size=-80000;
+    PRAGMA mmap_size=268435456;
+    PRAGMA temp_store=MEMORY;
+"""
 
 
 class SmartExtractor:
@@ -17,12 +30,26 @@ class SmartExtractor:
         self.db_path = db_path
         self.extractor = FirecrawlExtractor(api_key, db_path)
         
+        # URL filters below use insights.site, quality bonuses insights.ext_len;
+        # add them if this DB predates them
+        conn = self.get_connection()
+        migrate_domain(conn.cursor())
+        migrate_ext_len(conn.cursor())
+        conn.commit()
+        conn.close()
+        
+    def get_connection(self):
+        """Get database connection tuned for bulk scans and updates"""
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript(CONNECTION_PRAGMAS)
+        return conn
+        
     def select_best_100_articles(self) -> List[Dict]:
         """
         Select 100 best articles for extraction
         Criteria: quality score, diversity, recency, variety
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_connection()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -35,49 +62,46 @@ class SmartExtractor:
                        ELSE 0
                    END as recency_bonus,
                    CASE 
-                       WHEN source_url LIKE '%medium.com%' OR source_url LIKE '%substack.com%' 
-                            OR source_url LIKE '%github.com%' OR source_url LIKE '%fs.blog%' THEN 2
+                       WHEN site IN ('medium.com', 'substack.com', 'github.com', 'fs.blog') THEN 2
                        ELSE 0
                    END as domain_bonus
             FROM insights 
             WHERE content_category = 'external_link'
             AND extraction_status = 'pending'
-            AND source_url NOT LIKE '%linkedin.com%'
-            AND source_url NOT LIKE '%twitter.com%'
-            AND source_url NOT LIKE '%x.com%'
+            AND source_url IS NOT NULL
+            AND COALESCE(site, '') NOT IN ('linkedin.com', 'twitter.com', 'x.com')
             ORDER BY (quality_score + recency_bonus + domain_bonus) DESC, 
                      shared_date DESC
             LIMIT 200
         """)
         
-        candidates = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        # Diversify by domain
+        # Diversify by domain, streaming candidates until 100 are picked
         selected = []
         domain_counts = {}
         
-        for insight in candidates:
+        for row in chain.from_iterable(iter(lambda: cursor.fetchmany(50), [])):
             if len(selected) >= 100:
                 break
             
             # Extract domain
-            url = insight['source_url']
+            url = row['source_url']
             domain = self._extract_domain(url)
             
             # Limit per domain (max 15 from same source)
             if domain_counts.get(domain, 0) < 15:
-                selected.append(insight)
+                selected.append(dict(row))
                 domain_counts[domain] = domain_counts.get(domain, 0) + 1
         
+        conn.close()
         return selected
     
-    def _extract_domain(self, url: str) -> str:
-        """Extract domain from URL (handles invalid URLs gracefully)"""
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def _extract_domain(url: str) -> str:
+        """Extract domain from URL (handles invalid URLs gracefully; cached)"""
         if not url:
             return 'unknown'
         try:
-            from urllib.parse import urlparse
             parsed = urlparse(url)
             domain = parsed.netloc.replace('www.', '')
             return domain if domain else 'unknown'
@@ -88,8 +112,10 @@ class SmartExtractor:
                 return domain.replace('www.', '')
             return 'unknown'
     
-    def extract_best_100(self, delay: float = 1.5) -> Dict:
-        """Extract content from best 100 articles"""
+    def extract_best_100(self, delay: float = 1.5, max_workers: int = 8) -> Dict:
+        """Extract content from best 100 articles
+        Different sites are scraped concurrently; `delay` spaces requests per domain.
+        """
         print("\n🎯 Smart Extraction: Best 100 Articles")
         print("="*70)
         
@@ -112,11 +138,14 @@ class SmartExtractor:
             print(f"   {domain}: {count}")
         
         print(f"\n🚀 Starting extraction...")
-        print(f"   Delay: {delay}s between requests")
-        print(f"   Estimated time: ~{int(len(articles) * delay / 60)} minutes\n")
+        print(f"   Delay: {delay}s between requests to the same domain, {max_workers} workers")
+        # The busiest domain sets the floor on wall time
+        longest = max(domains.values(), default=0)
+        print(f"   Estimated time: at least {int(longest * delay)}s\n")
         
         # Extract with progress and checkpointing
-        stats = self.extractor.process_batch(articles, delay=delay)
+        stats = self.extractor.process_batch(articles, delay=delay, max_workers=max_workers,
+                                             per_domain=True)
         
         return stats
     
@@ -125,16 +154,14 @@ class SmartExtractor:
         print("\n📱 Preparing Social Media References")
         print("="*70)
         
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_connection()
         cursor = conn.cursor()
         
         # Get all social media URLs
         cursor.execute("""
             SELECT id, source_url, content, context_message, source_type
             FROM insights 
-            WHERE (source_url LIKE '%linkedin.com%' 
-                   OR source_url LIKE '%twitter.com%' 
-                   OR source_url LIKE '%x.com%')
+            WHERE site IN ('linkedin.com', 'twitter.com', 'x.com')
             AND extraction_status = 'pending'
         """)
         
@@ -143,6 +170,8 @@ class SmartExtractor:
         
         linkedin_count = 0
         twitter_count = 0
+        now_iso = datetime.now().isoformat()
+        updates = []
         
         for insight_id, url, content, context, source_type in social_links:
             # Create smart reference
@@ -164,26 +193,27 @@ class SmartExtractor:
             metadata = json.dumps({
                 'platform': platform,
                 'url': url,
-                'saved_date': datetime.now().isoformat(),
+                'saved_date': now_iso,
                 'type': 'social_reference'
             })
-            
-            # Update database
-            cursor.execute("""
-                UPDATE insights 
-                SET extracted_text = ?,
-                    extracted_metadata = ?,
-                    extraction_status = 'social_reference',
-                    extraction_date = ?,
-                    content_category = 'social_reference'
-                WHERE id = ?
-            """, (reference_text, metadata, datetime.now().isoformat(), insight_id))
+            updates.append((reference_text, metadata, now_iso, insight_id))
             
             if platform == "LinkedIn":
                 linkedin_count += 1
             else:
                 twitter_count += 1
         
+        # Update database: one prepared statement, one transaction
+        cursor.execute("BEGIN")
+        cursor.executemany("""
+            UPDATE insights 
+            SET extracted_text = ?,
+                extracted_metadata = ?,
+                extraction_status = 'social_reference',
+                extraction_date = ?,
+                content_category = 'social_reference'
+            WHERE id = ?
+        """, updates)
         conn.commit()
         conn.close()
         
@@ -198,22 +228,25 @@ class SmartExtractor:
         print("\n🏷️  Enhancing Content Categorization")
         print("="*70)
         
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_connection()
         cursor = conn.cursor()
         
+        # All updates below commit together
+        cursor.execute("BEGIN")
+        
         # Update categories based on URL patterns and content
         updates = [
             # Articles with extracted content
             ("article", "source_url IS NOT NULL AND extracted_text IS NOT NULL AND extraction_status = 'success'"),
             
             # YouTube videos
-            ("video", "source_url LIKE '%youtube.com%' OR source_url LIKE '%youtu.be%'"),
+            ("video", "site IN ('youtube.com', 'youtu.be')"),
             
             # GitHub code/docs
-            ("code", "source_url LIKE '%github.com%'"),
+            ("code", "site = 'github.com'"),
             
             # Reddit discussions
-            ("discussion", "source_url LIKE '%reddit.com%'"),
+            ("discussion", "site = 'reddit.com'"),
             
             # Social references (already handled above)
             # My notes (already categorized)
@@ -228,8 +261,9 @@ class SmartExtractor:
             """, (category,))
             print(f"   {category}: {cursor.rowcount} insights")
         
-        # Add useful_for_daily flag
-        cursor.execute("ALTER TABLE insights ADD COLUMN useful_for_daily INTEGER DEFAULT 1")
+        # Add useful_for_daily flag (first run only)
+        if 'useful_for_daily' not in table_columns(cursor, 'insights'):
+            cursor.execute("ALTER TABLE insights ADD COLUMN useful_for_daily INTEGER DEFAULT 1")
         
         # Mark personal and junk as not useful for daily
         cursor.execute("""
@@ -250,19 +284,22 @@ class SmartExtractor:
         print("\n⭐ Enhancing Quality Scores")
         print("="*70)
         
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_connection()
         cursor = conn.cursor()
         
-        # Enhance based on extracted content
+        # All updates below commit together
+        cursor.execute("BEGIN")
+        
+        # Enhance based on extracted content (only rows that get a bonus, via idx_insights_ext_len)
         cursor.execute("""
             UPDATE insights 
             SET quality_score = quality_score + 
                 CASE 
-                    WHEN LENGTH(extracted_text) > 5000 THEN 1
-                    WHEN LENGTH(extracted_text) > 2000 THEN 0.5
-                    ELSE 0
+                    WHEN ext_len > 5000 THEN 1
+                    ELSE 0.5
                 END
-            WHERE extraction_status = 'success'
+            WHERE ext_len > 2000
+            AND extraction_status = 'success'
         """)
         print(f"   Enhanced {cursor.rowcount} articles (based on length)")
         
@@ -276,14 +313,12 @@ class SmartExtractor:
         print(f"   Enhanced {cursor.rowcount} with metadata")
         
         # Enhance high-quality domains
-        quality_domains = ['medium.com', 'substack.com', 'fs.blog', 'github.com']
-        for domain in quality_domains:
-            cursor.execute(f"""
-                UPDATE insights 
-                SET quality_score = quality_score + 1
-                WHERE source_url LIKE '%{domain}%'
-                AND quality_score < 9
-            """)
+        cursor.execute("""
+            UPDATE insights 
+            SET quality_score = quality_score + 1
+            WHERE site IN ('medium.com', 'substack.com', 'fs.blog', 'github.com')
+            AND quality_score < 9
+        """)
         
         # Enhance long personal notes
         cursor.execute("""
@@ -324,8 +359,7 @@ def run_smart_extraction(api_key: str):
     try:
         extractor.enhance_categorization()
     except Exception as e:
-        if "duplicate column" not in str(e):
-            print(f"   Note: {e}")
+        print(f"   Note: {e}")
     
     # Step 4: Enhance quality scores
     print("\n[4/5] Enhancing Quality Scores")
@@ -3,7 +3,7 @@
 Test script to verify the Brain Gym parser works correctly
 """
 from parser import WhatsAppParser
-from database import BrainGymDB
+from database import BrainGymDB, insert_insight_row
 from classifier import InsightClassifier
 
 
@@ -49,6 +49,28 @@ def test_parser():
             print(f"    URL: {insight['source_url']}")
 
 
+def test_url_extraction():
+    """URLs keep their path, query and percent-escapes"""
+    parser = WhatsAppParser()
+    messages = parser.parse_content(
+        "[12/01/2024, 10:15:30] Alice: see https://example.com/a%20b?x=1&y=(2) now\n"
+        "more at http://fs.blog/first-principles/"
+    )
+    
+    assert len(messages) == 1
+    assert messages[0].urls == [
+        "https://example.com/a%20b?x=1&y=(2)",
+        "http://fs.blog/first-principles/",
+    ]
+    
+    # A trailing bracket is kept in the URL and must not break typing
+    parser.parse_content("[12/01/2024, 10:15:30] Alice: great read [https://example.com]")
+    assert parser.messages[0].urls == ["https://example.com]"]
+    assert parser.get_url_type("https://example.com]") == 'link'
+    assert parser.get_url_type("https://blog.example.com]") == 'article'
+    assert [i['source_type'] for i in parser.extract_insights()] == ['link']
+
+
 def test_classifier():
     """Test the content classifier"""
     print("\n\n🧪 Testing Content Classifier")
@@ -107,6 +129,26 @@ def test_database():
     print("\n⚠ Note: Test database saved as 'test_braingym.db'")
 
 
+def test_database_dedup(tmp_path):
+    """Duplicate inserts are rejected by the content_hash UNIQUE index"""
+    db = BrainGymDB(str(tmp_path / "dedup.db"))
+    
+    first = db.insert_insight(content="Same  insight", source_url="https://example.com/a")
+    again = db.insert_insight(content="Same insight", source_url="https://example.com/a")
+    other = db.insert_insight(content="Same insight", source_url="https://example.com/b")
+    
+    assert first is not None
+    assert again is None
+    assert other is not None
+    assert db.get_stats()['total_insights'] == 2
+    
+    # The app insert paths share the same hashed insert
+    with db.get_connection() as conn:
+        assert insert_insight_row(conn.cursor(), content="Same insight", source_url="https://example.com/b") is None
+        assert insert_insight_row(conn.cursor(), content="A note", source_type="my_note") is not None
+    assert db.get_stats()['total_insights'] == 3
+
+
 if __name__ == "__main__":
     print("\n🧠 Brain Gym Test Suite")
     print("="*60)
@@ -2,59 +2,179 @@
 Utility functions for Brain Gym web interface
 Helper functions for daily selection, search, stats, etc.
 """
+import itertools
+import queue
 import sqlite3
-from datetime import datetime, timedelta
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
 from typing import List, Dict, Optional
 import random
+from database import migrate_content_hash
+from plg_migrate import migrate_domain, migrate_responses_fts, migrate_tag_counts, tag_rows_sql
+
+# Long-lived connections shared by the web app's request threads
+POOL_SIZE = 4
+STATS_TTL = 30  # seconds; get_stats is shown on every page, counts change slowly
+OPTIMIZE_EVERY = 100  # connection returns between PRAGMA optimize runs
+
+# WAL, 64MB page cache, 256MB mmap, in-memory temp tables
+CONNECTION_PRAGMAS = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA busy_timeout=5000;
+    PRAGMA cache_size=-64000;
+    PRAGMA mmap_size=268435456;
+    PRAGMA temp_store=MEMORY;
+"""
+
+# Insight columns the library/search pages and format_insight_content read
+RESPONSE_INSIGHT_COLUMNS = ('id', 'content', 'source_url', 'source_type', 'shared_date', 'tags',
+                            'content_category', 'extracted_text', 'extraction_status')
 
 
 class BrainGymUtils:
     """Utility functions for Brain Gym web interface"""
     
-    def __init__(self, db_path: str = "braingym.db"):
+    def __init__(self, db_path: str = "braingym.db", pool_size: int = POOL_SIZE):
         self.db_path = db_path
+        self._stats_cache = None  # (monotonic time, stats dict)
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._returns = itertools.count(1)
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+        # Fans get_stats' independent queries out over the pool (WAL readers don't block)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size)
+        
+        # /add dedups on insights.content_hash, variety reads insights.domain (the
+        # host, as the old netloc check used), search_responses matches through
+        # responses_fts; add them if this DB predates them
+        with self.borrow() as conn:
+            migrate_content_hash(conn.cursor())
+            migrate_domain(conn.cursor())
+            migrate_responses_fts(conn.cursor())
+            migrate_tag_counts(conn.cursor())
+            
+            # Planner statistics for the indexes above, gathered once per database
+            if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+                conn.execute("ANALYZE")
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.executescript(CONNECTION_PRAGMAS)
+        return conn
     
     def get_connection(self):
-        """Get database connection"""
+        """Get a new database connection (caller closes it)"""
         conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row
         return conn
     
+    @contextmanager
+    def borrow(self):
+        """Borrow a pooled connection; commits (or rolls back) and returns it to the pool"""
+        conn = self._pool.get()
+        try:
+            yield conn
+            conn.commit()
+            if next(self._returns) % OPTIMIZE_EVERY == 0:
+                # Refresh stale planner statistics (cheap; usually a no-op)
+                try:
+                    conn.execute("PRAGMA optimize")
+                except sqlite3.OperationalError:
+                    pass  # Database busy; the next round will catch up
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._pool.put(conn)
+    
     def get_daily_three(self) -> List[Dict]:
         """
         Get 3 insights for daily practice
         Algorithm: quality + variety + not shown recently + unresponded
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         today = datetime.now().date().isoformat()
-        yesterday = (datetime.now().date() - timedelta(days=1)).isoformat()
         
-        # Get candidates: unresponded, useful, not shown today
+        # Get candidates: unresponded, useful, not shown today. Ids are
+        # streamed in idx_insights_daily order (see plg_migrate), no sort
         query = """
-            SELECT * FROM insights
+            SELECT id, quality_score FROM insights
             WHERE status = 'pending'
             AND useful_for_daily = 1
             AND is_duplicate = 0
             AND (last_shown_date IS NULL OR last_shown_date < ?)
-            ORDER BY quality_score DESC, RANDOM()
-            LIMIT 50
+            ORDER BY quality_score DESC
         """
         
-        cursor.execute(query, (today,))
-        candidates = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        if len(candidates) <= 3:
-            return candidates
-        
-        # Select 3 with variety
-        selected = self._ensure_variety(candidates, 3)
-        
-        # Mark as shown
-        for insight in selected:
-            self.mark_shown(insight['id'])
+        with self.borrow() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None  # plain (id, quality_score) tuples
+            candidate_ids = self._sample_top(cursor.execute(query, (today,)), 50)
+            
+            # Only what _ensure_variety reads; full rows are fetched for the picks alone
+            placeholders = ','.join('?' * len(candidate_ids))
+            cursor = conn.execute(f"""
+                SELECT id, content_category, domain FROM insights WHERE id IN ({placeholders})
+            """, candidate_ids)
+            by_id = {row['id']: row for row in cursor.fetchall()}  # sqlite3.Row
+            candidates = [by_id[insight_id] for insight_id in candidate_ids]
+            
+            if len(candidates) <= 3:
+                selected = candidates
+            else:
+                # Select 3 with variety
+                selected = self._ensure_variety(candidates, 3)
+            
+            ids = [insight['id'] for insight in selected]
+            placeholders = ','.join('?' * len(ids))
+            cursor = conn.execute(f"SELECT * FROM insights WHERE id IN ({placeholders})", ids)
+            rows = {row['id']: dict(row) for row in cursor.fetchall()}
+            
+            if len(candidates) > 3:
+                # Mark as shown, one statement on the same connection
+                conn.execute(f"""
+                    UPDATE insights 
+                    SET last_shown_date = ?
+                    WHERE id IN ({placeholders})
+                """, (today, *ids))
+        
+        return [rows[insight_id] for insight_id in ids]
+    
+    def _sample_top(self, rows, count: int) -> List[int]:
+        """
+        Ids of the first `count` (id, quality_score) rows, which come sorted by
+        quality_score DESC; random order within each quality tier (reservoir-
+        sampling the tier that is cut), like ORDER BY quality_score DESC, RANDOM()
+        """
+        selected = []
+        tier = []
+        tier_quality = object()  # matches no score, so the first row opens a tier
+        seen = 0
+        
+        for insight_id, quality in rows:
+            if quality != tier_quality:
+                random.shuffle(tier)
+                selected.extend(tier)
+                if len(selected) >= count:
+                    break
+                tier = []
+                tier_quality = quality
+                seen = 0
+            
+            seen += 1
+            room = count - len(selected)
+            if len(tier) < room:
+                tier.append(insight_id)
+            else:
+                slot = random.randrange(seen)
+                if slot < room:
+                    tier[slot] = insight_id
+        else:
+            random.shuffle(tier)
+            selected.extend(tier)
         
         return selected
     
@@ -64,6 +184,7 @@ class BrainGymUtils:
             return candidates
         
         selected = []
+        selected_ids = set()
         used_categories = set()
         used_domains = set()
         
@@ -72,86 +193,77 @@ class BrainGymUtils:
             if len(selected) >= count:
                 break
             
-            category = insight.get('content_category', '')
-            source_url = insight.get('source_url', '')
-            domain = self._extract_domain(source_url) if source_url else 'none'
+            category = insight['content_category'] or ''
+            domain = insight['domain'] or 'none'
             
             # Prefer items with different categories and domains
             if category not in used_categories or domain not in used_domains:
                 selected.append(insight)
+                selected_ids.add(insight['id'])
                 if category:
                     used_categories.add(category)
                 if domain:
                     used_domains.add(domain)
         
         # Fill remaining slots if needed
-        while len(selected) < count and len(selected) < len(candidates):
-            for insight in candidates:
-                if insight not in selected:
-                    selected.append(insight)
-                    if len(selected) >= count:
-                        break
+        for insight in candidates:
+            if len(selected) >= count:
+                break
+            if insight['id'] not in selected_ids:
+                selected.append(insight)
+                selected_ids.add(insight['id'])
         
-        return selected[:count]
-    
-    def _extract_domain(self, url: str) -> str:
-        """Extract domain from URL"""
-        from urllib.parse import urlparse
-        parsed = urlparse(url)
-        return parsed.netloc.replace('www.', '')
+        return selected
     
-    def mark_shown(self, insight_id: int):
-        """Mark insight as shown today"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        today = datetime.now().date().isoformat()
-        
-        cursor.execute("""
-            UPDATE insights 
-            SET last_shown_date = ?
-            WHERE id = ?
-        """, (today, insight_id))
-        
-        conn.commit()
-        conn.close()
+    def mark_shown(self, insight_id: int, today: str = None):
+        """Mark insight as shown today (pass `today` when the caller already has it)"""
+        if today is None:
+            today = datetime.now().date().isoformat()
+        
+        with self.borrow() as conn:
+            conn.execute("""
+                UPDATE insights 
+                SET last_shown_date = ?
+                WHERE id = ?
+            """, (today, insight_id))
     
     def save_response(self, insight_id: int, response_text: str) -> int:
         """Save user's response to an insight"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Insert response
-        cursor.execute("""
-            INSERT INTO responses (insight_id, response_text, created_at)
-            VALUES (?, ?, ?)
-        """, (insight_id, response_text, datetime.now().isoformat()))
-        
-        response_id = cursor.lastrowid
-        
-        # Update insight status
-        cursor.execute("""
-            UPDATE insights 
-            SET my_response = ?,
-                response_date = ?,
-                status = 'responded'
-            WHERE id = ?
-        """, (response_text, datetime.now().isoformat(), insight_id))
-        
-        conn.commit()
-        conn.close()
+        now = datetime.now().isoformat()
         
+        with self.borrow() as conn:
+            cursor = conn.cursor()
+            
+            # Take the write lock once, up front, for both statements
+            cursor.execute("BEGIN IMMEDIATE")
+            
+            # Insert response
+            cursor.execute("""
+                INSERT INTO responses (insight_id, response_text, created_at)
+                VALUES (?, ?, ?)
+            """, (insight_id, response_text, now))
+            
+            response_id = cursor.lastrowid
+            
+            # Update insight status
+            cursor.execute("""
+                UPDATE insights 
+                SET my_response = ?,
+                    response_date = ?,
+                    status = 'responded'
+                WHERE id = ?
+            """, (response_text, now, insight_id))
+        
+        self.invalidate_stats()
         return response_id
     
     def search_responses(self, query: str = None, tag: str = None, 
                         limit: int = 50) -> List[Dict]:
         """Search through user's responses"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        sql = """
+        columns = ', '.join(f'i.{column}' for column in RESPONSE_INSIGHT_COLUMNS)
+        sql = f"""
             SELECT 
-                i.*,
+                {columns},
                 r.response_text,
                 r.created_at as response_created_at
             FROM insights i
@@ -160,58 +272,57 @@ class BrainGymUtils:
         """
         params = []
         
-        if query:
-            sql += " AND (r.response_text LIKE ? OR i.content LIKE ? OR i.extracted_text LIKE ?)"
-            search_term = f"%{query}%"
-            params.extend([search_term, search_term, search_term])
-        
         if tag:
             sql += " AND i.tags LIKE ?"
             params.append(f"%{tag}%")
         
-        sql += " ORDER BY r.created_at DESC LIMIT ?"
-        params.append(limit)
-        
-        cursor.execute(sql, params)
-        results = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        order = " ORDER BY r.created_at DESC LIMIT ?"
+        
+        with self.borrow() as conn:
+            if query:
+                # Whole query as one phrase, last word as a prefix (so "mark" finds "marketing")
+                phrase = '"' + query.replace('"', '""') + '" *'
+                match_sql = sql + """
+                    AND (r.id IN (SELECT rowid FROM responses_fts WHERE responses_fts MATCH ?)
+                         OR i.id IN (SELECT rowid FROM insights_fts WHERE insights_fts MATCH ?))
+                """
+                try:
+                    cursor = conn.execute(match_sql + order,
+                                          [*params, phrase, '{content extracted_text} : ' + phrase, limit])
+                except sqlite3.OperationalError:
+                    # Full-text indexes not built for this database (or unparseable query)
+                    search_term = f"%{query}%"
+                    cursor = conn.execute(
+                        sql + " AND (r.response_text LIKE ? OR i.content LIKE ? OR i.extracted_text LIKE ?)" + order,
+                        [*params, search_term, search_term, search_term, limit])
+            else:
+                cursor = conn.execute(sql + order, [*params, limit])
+            results = [dict(row) for row in cursor.fetchall()]
         
         return results
     
+    def invalidate_stats(self):
+        """Drop the cached get_stats result (call after writes that change it)"""
+        self._stats_cache = None
+    
     def get_stats(self) -> Dict:
-        """Get comprehensive statistics"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        stats = {}
+        """Get comprehensive statistics (cached for STATS_TTL seconds)"""
+        cached = self._stats_cache
+        if cached and time.monotonic() - cached[0] < STATS_TTL:
+            return cached[1]
         
-        # Total insights
-        cursor.execute("SELECT COUNT(*) as count FROM insights WHERE useful_for_daily = 1")
-        stats['total_useful'] = cursor.fetchone()['count']
+        queries = (self._category_counts, self._response_count,
+                   self._calculate_streak, self._top_themes)
+        futures = [self._executor.submit(self._on_pooled_cursor, query) for query in queries]
+        by_category, total_responses, current_streak, top_themes = [f.result() for f in futures]
         
-        # Responses
-        cursor.execute("SELECT COUNT(*) as count FROM responses")
-        stats['total_responses'] = cursor.fetchone()['count']
-        
-        # Pending
-        cursor.execute("""
-            SELECT COUNT(*) as count FROM insights 
-            WHERE status = 'pending' AND useful_for_daily = 1
-        """)
-        stats['pending'] = cursor.fetchone()['count']
-        
-        # By category
-        cursor.execute("""
-            SELECT content_category, COUNT(*) as count 
-            FROM insights 
-            WHERE useful_for_daily = 1
-            GROUP BY content_category
-        """)
+        stats = {}
+        stats['total_useful'] = sum(row['count'] for row in by_category)
+        stats['total_responses'] = total_responses
+        stats['pending'] = sum(row['pending'] for row in by_category)
         stats['by_category'] = {row['content_category']: row['count'] 
-                               for row in cursor.fetchall()}
-        
-        # Current streak
-        stats['current_streak'] = self._calculate_streak(cursor)
+                               for row in by_category}
+        stats['current_streak'] = current_streak
         
         # Response rate
         if stats['total_useful'] > 0:
@@ -219,92 +330,99 @@ class BrainGymUtils:
         else:
             stats['response_rate'] = 0
         
-        # Top themes
-        cursor.execute("""
-            SELECT i.tags, COUNT(*) as count
-            FROM insights i
-            INNER JOIN responses r ON i.id = r.insight_id
-            WHERE i.tags IS NOT NULL
-            GROUP BY i.tags
-            ORDER BY count DESC
-            LIMIT 10
-        """)
-        
-        theme_counts = {}
-        for row in cursor.fetchall():
-            if row['tags']:
-                tags = row['tags'].split(',')
-                for tag in tags:
-                    tag = tag.strip()
-                    theme_counts[tag] = theme_counts.get(tag, 0) + row['count']
-        
-        stats['top_themes'] = sorted(theme_counts.items(), key=lambda x: x[1], reverse=True)[:10]
+        stats['top_themes'] = top_themes
         
-        conn.close()
+        self._stats_cache = (time.monotonic(), stats)
         return stats
     
-    def _calculate_streak(self, cursor) -> int:
-        """Calculate current response streak"""
+    def _on_pooled_cursor(self, query):
+        """Run query(cursor) on a connection of its own from the pool"""
+        with self.borrow() as conn:
+            return query(conn.cursor())
+    
+    def _category_counts(self, cursor) -> List[sqlite3.Row]:
+        """Totals, pending and per-category counts of the useful insights"""
+        # One pass, covered by idx_insights_useful_cat_status (see plg_migrate)
         cursor.execute("""
-            SELECT DISTINCT DATE(created_at) as date
-            FROM responses
-            ORDER BY date DESC
-            LIMIT 30
+            SELECT content_category, COUNT(*) as count,
+                   SUM(status = 'pending') as pending
+            FROM insights 
+            WHERE useful_for_daily = 1
+            GROUP BY content_category
         """)
-        
-        dates = [row['date'] for row in cursor.fetchall()]
-        if not dates:
-            return 0
-        
-        streak = 0
-        current_date = datetime.now().date()
-        
-        for i in range(30):
-            check_date = (current_date - timedelta(days=i)).isoformat()
-            if check_date in dates:
-                streak += 1
-            else:
-                break
-        
-        return streak
+        return cursor.fetchall()
+    
+    def _response_count(self, cursor) -> int:
+        cursor.execute("SELECT COUNT(*) as count FROM responses")
+        return cursor.fetchone()['count']
+    
+    def _top_themes(self, cursor) -> List[tuple]:
+        """Tags of responded insights, counted per response (top 10)"""
+        try:
+            # Maintained by triggers (see plg_migrate.migrate_tag_counts)
+            cursor.execute("""
+                SELECT tag, c as count FROM tag_counts
+                ORDER BY c DESC, tag
+                LIMIT 10
+            """)
+        except sqlite3.OperationalError:
+            # No insight_tags yet, so no tag_counts; split insights.tags inline
+            tag_rows = tag_rows_sql('insights.id', 'insights.tags', source='insights,')
+            cursor.execute(f"""
+                SELECT t.tag, COUNT(*) as count
+                FROM responses r
+                JOIN ({tag_rows}) t ON t.insight_id = r.insight_id
+                GROUP BY t.tag
+                ORDER BY count DESC, t.tag
+                LIMIT 10
+            """)
+        return [(row['tag'], row['count']) for row in cursor.fetchall()]
+    
+    def _calculate_streak(self, cursor) -> int:
+        """Calculate current response streak (consecutive days up to today, max 30)"""
+        # Walk back one day at a time while that day has a response; each step
+        # is a range probe on idx_responses_created (see plg_migrate)
+        cursor.execute("""
+            WITH RECURSIVE streak(n) AS (
+                SELECT 0
+                UNION ALL
+                SELECT n + 1 FROM streak
+                WHERE n < 30 AND EXISTS (
+                    SELECT 1 FROM responses
+                    WHERE created_at >= DATE(:today, -n || ' days')
+                    AND created_at < DATE(:today, (1 - n) || ' days')
+                )
+            )
+            SELECT MAX(n) as streak FROM streak
+        """, {'today': datetime.now().date().isoformat()})
+        
+        return cursor.fetchone()['streak']
     
     def get_insight(self, insight_id: int) -> Optional[Dict]:
         """Get a single insight by ID"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM insights WHERE id = ?", (insight_id,))
-        row = cursor.fetchone()
-        conn.close()
+        with self.borrow() as conn:
+            row = conn.execute("SELECT * FROM insights WHERE id = ?", (insight_id,)).fetchone()
         
         return dict(row) if row else None
     
     def skip_insight(self, insight_id: int):
         """Mark insight as skipped"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            UPDATE insights 
-            SET times_skipped = COALESCE(times_skipped, 0) + 1
-            WHERE id = ?
-        """, (insight_id,))
-        
-        conn.commit()
-        conn.close()
+        with self.borrow() as conn:
+            conn.execute("""
+                UPDATE insights 
+                SET times_skipped = COALESCE(times_skipped, 0) + 1
+                WHERE id = ?
+            """, (insight_id,))
     
     def archive_insight(self, insight_id: int):
         """Archive an insight"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            UPDATE insights 
-            SET archived = 1, 
-                status = 'archived',
-                useful_for_daily = 0
-            WHERE id = ?
-        """, (insight_id,))
-        
-        conn.commit()
-        conn.close()
+        with self.borrow() as conn:
+            conn.execute("""
+                UPDATE insights 
+                SET archived = 1, 
+                    status = 'archived',
+                    useful_for_daily = 0
+                WHERE id = ?
+            """, (insight_id,))
+        
+        self.invalidate_stats()